@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+# Response fields holding identifiers or personal data, besides those whose names end
+# in "Id" or "_id". Report parameters are anonymized by their `name`, so they are
+# matched the same way.
+ANONYMIZED_FIELDS = {
+    "id",
+    "invitedEmailAddress",
+    "emailAddress",
+    "email",
+    "userEmail",
+    "fullName",
+    "givenName",
+    "familyName",
+    "photoUrl",
+    "courseGroupEmail",
+    "teacherGroupEmail",
+    "alternateLink",
+    "enrollmentCode",
+    "identifier",
+    "display_name",
+    "ip_address",
+    "organizer_email",
+    "meeting_code",
+}
+
+
+def is_anonymized(field):
+    """Whether a response field or report parameter holds an identifier."""
+    return field in ANONYMIZED_FIELDS or field.endswith(("Id", "_id"))
+
+
+class Cassette:
+    """
+    A gzip compressed, newline-delimited file of recorded batch responses, keyed by
+    the API method and request ID. IDs and personal data are replaced with salted
+    hashes when recorded. The same value always gets the same hash within a
+    cassette, so courses found in one response still match the requests for them.
+
+    Parameters:
+        path:   The path to the cassette file.
+        salt:   A secret mixed into the hashes. Defaults to a random one.
+    """
+
+    def __init__(self, path, salt=None):
+        self.path = path
+        self.salt = salt or os.urandom(16).hex()
+
+    def anonymize(self, value):
+        if value is None or value == "None":
+            return value
+        digest = hashlib.sha256(f"{self.salt}{value}".encode()).hexdigest()[:12]
+        if isinstance(value, str) and "@" in value:
+            return f"anon-{digest}@example.com"
+        return f"anon-{digest}"
+
+    def anonymize_response(self, data):
+        """Returns a copy of the response with identifying fields anonymized."""
+        if isinstance(data, list):
+            return [self.anonymize_response(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        anonymized = {}
+        for (key, value) in data.items():
+            if is_anonymized(key) and not isinstance(value, (dict, list)):
+                anonymized[key] = self.anonymize(value)
+            else:
+                anonymized[key] = self.anonymize_response(value)
+        name = data.get("name")
+        if isinstance(name, str) and is_anonymized(name) and "value" in data:
+            anonymized["value"] = self.anonymize(data["value"])
+        return anonymized
+
+    def reset(self):
+        """Deletes any previous recording."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def record(self, entries):
+        """Appends the entries of one batch as their own gzip member."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(self.path, "at") as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+
+    def load(self):
+        """Returns the recorded entries as lists by key, in the order recorded."""
+        entries = {}
+        with gzip.open(self.path, "rt") as file:
+            for line in file:
+                entry = json.loads(line)
+                entries.setdefault(entry["key"], []).append(entry)
+        return entries
+
+
+def cassette_key(method_path, request_id, anonymize=None):
+    """
+    Returns the key a request is recorded and replayed under: its API method, its
+    endpoint and course, whether it has a date, and its page. The rest of a request ID
+    differs between runs, since dates hold usage dates, Meet windows and the course
+    work of fanned out courses, and page tokens and sizes depend on them. Requests
+    with the same key are answered in the order they were recorded. Recording
+    anonymizes the course ID, which replayed requests already have.
+    """
+    course_id, date, _, page, _ = request_id.split(";")
+    prefix, separator, course_id = course_id.rpartition(":")
+    if anonymize:
+        course_id = anonymize(course_id)
+    date = "None" if date == "None" else "date"
+    return f"{'.'.join(method_path)}|{prefix}{separator}{course_id};{date};{page}"
+
+
+class _RecordingResource:
+    """Proxies a resource or request of the real service, tracking its method path."""
+
+    def __init__(self, target, path):
+        self.target = target
+        self.path = path
+
+    def __getattr__(self, name):
+        return _RecordingResource(getattr(self.target, name), self.path + [name])
+
+    def __call__(self, *args, **kwargs):
+        return _RecordingResource(self.target(*args, **kwargs), self.path)
+
+
+class _RecordingBatch:
+    """Executes a real batch request and records each response to the cassette."""
+
+    def __init__(self, service, cassette, callback):
+        self.cassette = cassette
+        self.callback = callback
+        self.entries = []
+        self.keys = {}
+        self.batch = service.new_batch_http_request(callback=self._record)
+
+    def add(self, request, request_id):
+        key = cassette_key(request.path, request_id, self.cassette.anonymize)
+        self.keys[request_id] = key
+        self.batch.add(request.target, request_id=request_id)
+
+    def _record(self, request_id, response, exception):
+        entry = {"key": self.keys[request_id]}
+        if exception:
+            entry["status"] = getattr(getattr(exception, "resp", None), "status", None)
+            entry["error"] = str(exception)
+        else:
+            entry["response"] = self.cassette.anonymize_response(response)
+        self.entries.append(entry)
+        self.callback(request_id, response, exception)
+
+    def execute(self):
+        start = time.time()
+        try:
+            self.batch.execute()
+        finally:
+            seconds = round(time.time() - start, 3)
+            for entry in self.entries:
+                entry["batch_seconds"] = seconds
+            self.cassette.record(self.entries)
+            self.entries = []
+
+
+class RecordingService:
+    """
+    Wraps a Google API service so every batch response it returns is also recorded
+    to a cassette, with the time the batch took.
+
+    Parameters:
+        service:    The real Google API service.
+        cassette:   The Cassette to record to.
+    """
+
+    def __init__(self, service, cassette):
+        self.service = service
+        self.cassette = cassette
+
+    def __getattr__(self, name):
+        return _RecordingResource(getattr(self.service, name), [name])
+
+    def new_batch_http_request(self, callback):
+        return _RecordingBatch(self.service, self.cassette, callback)
+
+
+class _ReplayResource:
+    """Stands in for any resource or request, tracking the method path called."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __getattr__(self, name):
+        return _ReplayResource(self.path + [name])
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+class _ReplayBatch:
+    """Answers a batch request with the responses recorded for its requests."""
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((cassette_key(request.path, request_id), request_id))
+
+    def execute(self):
+        entries = [
+            (self.service.next_entry(key), request_id)
+            for (key, request_id) in self.requests
+        ]
+        if self.service.latency and entries:
+            time.sleep(max([entry.get("batch_seconds", 0) for (entry, _) in entries]))
+        for (entry, request_id) in entries:
+            if "response" in entry:
+                self.callback(request_id, entry["response"], None)
+            else:
+                status = entry["status"] or 500
+                error = HttpError(Response({"status": status}), b"")
+                self.callback(request_id, None, error)
+
+
+class ReplayService:
+    """
+    Serves recorded responses back in place of a Google API service, without any
+    network access. Requests that were recorded more than once, like retries, get
+    their responses in the order they were recorded.
+
+    Parameters:
+        cassette:   The Cassette to replay.
+        latency:    If True, each batch sleeps for as long as it took when recorded.
+    """
+
+    def __init__(self, cassette, latency=False):
+        self.entries = cassette.load()
+        self.latency = latency
+
+    def __getattr__(self, name):
+        return _ReplayResource([name])
+
+    def new_batch_http_request(self, callback):
+        return _ReplayBatch(self, callback)
+
+    def next_entry(self, key):
+        """
+        Returns the next recorded entry for a key, repeating the last one. Requests
+        that weren't recorded get an empty response, rather than an error that would
+        be retried or dead lettered.
+        """
+        entries = self.entries.get(key)
+        if not entries:
+            logging.debug(f"Replay: nothing recorded for {key}.")
+            return {"response": {}}
+        return entries.pop(0) if len(entries) > 1 else entries[0]
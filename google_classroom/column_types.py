@@ -0,0 +1,79 @@
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import types
+from sqlalchemy.dialects import mssql
+
+
+class ColumnType:
+    """
+    The type of an endpoint column: how it is held in a dataframe, the SQL type its
+    table is created with, and the Arrow type it is written to Parquet as.
+    """
+
+    def __init__(self, dtype, sql_type, arrow_type):
+        self.dtype = dtype
+        self.sql_type = sql_type
+        self.arrow_type = arrow_type
+
+    def convert(self, series):
+        return series.astype(self.dtype)
+
+
+class String(ColumnType):
+    """Free text. A length bounds the SQL column, otherwise it is unbounded."""
+
+    def __init__(self, length=None):
+        sql_type = types.String(length) if length else types.Text()
+        super().__init__("object", sql_type, pa.string())
+
+
+class Category(ColumnType):
+    """
+    A string with few distinct values, like an enum, stored as a categorical. The
+    longest Classroom enum values, like SUBMISSION_MODIFICATION_MODE_UNSPECIFIED,
+    are around 40 characters, so the default leaves room for longer ones.
+    """
+
+    def __init__(self, length=64):
+        arrow_type = pa.dictionary(pa.int32(), pa.string())
+        super().__init__("category", types.String(length), arrow_type)
+
+
+class Integer(ColumnType):
+    def __init__(self):
+        super().__init__("Int64", types.BigInteger(), pa.int64())
+
+    def convert(self, series):
+        # The API sends 64 bit integers as strings.
+        return pd.to_numeric(series, errors="coerce").astype(self.dtype)
+
+
+class Float(ColumnType):
+    def __init__(self):
+        super().__init__("float64", types.Float(), pa.float64())
+
+    def convert(self, series):
+        return pd.to_numeric(series, errors="coerce").astype(self.dtype)
+
+
+class Boolean(ColumnType):
+    def __init__(self):
+        super().__init__("boolean", types.Boolean(), pa.bool_())
+
+
+class DateTime(ColumnType):
+    """
+    A timestamp. On MSSQL it is a DATETIME2, since DATETIME rounds to 1/300 of a
+    second and times read back wouldn't match the ones received.
+    """
+
+    def __init__(self):
+        sql_type = types.DateTime().with_variant(mssql.DATETIME2(), "mssql")
+        super().__init__("datetime64[ns]", sql_type, pa.timestamp("ns"))
+
+
+# Google IDs, emails and enums are short, so most endpoints share these.
+ID = String(64)
+EMAIL = String(320)
+NAME = String(255)
+LINK = String(2048)
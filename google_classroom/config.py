@@ -4,6 +4,8 @@ import os
 import argparse
 from sqlsorcery import MSSQL, PostgreSQL, SQLite
 
+from pool import configure_pool, PoolStats
+
 
 def get_args():
     parser = argparse.ArgumentParser(description="Pick which ones")
@@ -45,15 +47,60 @@ def get_args():
         "--debug", help="Set logging level for troubleshooting", action="store_true"
     )
     parser.add_argument(
-        "--debugfile", help="Log raw json to a file", action="store_true"
+        "--profile",
+        help="Profile each endpoint's pull, saving reports to data/",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--debugfile",
+        help="Archive raw responses to compressed files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reprocess",
+        help="Rebuild tables from the raw response archive without calling the API",
+        action="store_true",
     )
     parser.add_argument(
         "--sync", help="Sync courses back to Google Classroom", action="store_true"
     )
+    parser.add_argument(
+        "--daemon",
+        help="Keep running and pull each endpoint on its own schedule",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--autotune",
+        help="Tune batch and page sizes per endpoint at runtime",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--combined",
+        help="Pull per-course endpoints together in shared batches",
+        action="store_true",
+    )
     args, _ = parser.parse_known_args()
     return args
 
 
+def parse_sink_overrides(value):
+    """
+    Parses per-endpoint sinks written as "Endpoint:sink,sink;Endpoint:sink" into a
+    dict of endpoint names to lists of sinks.
+    """
+    overrides = {}
+    for override in filter(None, (value or "").split(";")):
+        name, sinks = override.split(":", 1)
+        overrides[name.strip()] = [sink.strip() for sink in sinks.split(",")]
+    return overrides
+
+
+def parse_list(value):
+    """Parses a comma separated list, returning None if it's empty."""
+    values = [item.strip() for item in (value or "").split(",") if item.strip()]
+    return values or None
+
+
 class Config(object):
     """Base configuration object"""
 
@@ -71,10 +118,21 @@ class Config(object):
     DB_USER = os.getenv("DB_USER")
     DB_PWD = os.getenv("DB_PWD")
     DB_SCHEMA = os.getenv("DB_SCHEMA")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 5)
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW") or 10)
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE") or 3600)
 
     # Debug config
     DEBUG = os.getenv("DEBUG") == "YES" or args.debug
     DEBUGFILE = os.getenv("DEBUGFILE") == "YES" or args.debugfile
+    PROFILE = os.getenv("PROFILE") == "YES" or args.profile
+    PROFILE_MEMORY = os.getenv("PROFILE_MEMORY") == "YES"
+    PROFILE_TOP = int(os.getenv("PROFILE_TOP") or 10)
+    REPROCESS = os.getenv("REPROCESS") == "YES" or args.reprocess
+    RECORD_CASSETTE = os.getenv("RECORD_CASSETTE")
+    REPLAY_CASSETTE = os.getenv("REPLAY_CASSETTE")
+    REPLAY_LATENCY = os.getenv("REPLAY_LATENCY") == "YES"
+    CASSETTE_SALT = os.getenv("CASSETTE_SALT")
 
     # Which endpoints to pull data from
     PULL_ALL = os.getenv("PULL_ALL") == "YES" or args.all
@@ -101,9 +159,31 @@ class Config(object):
         os.getenv("PULL_ANNOUNCEMENTS") == "YES" or PULL_ALL or args.announcements
     )
     PULL_MEET = os.getenv("PULL_MEET") == "YES" or PULL_ALL or args.meet
+    COMBINED_PULL = os.getenv("COMBINED_PULL") == "YES" or args.combined
+
+    # Progress config
+    PROGRESS_LOG_SECONDS = int(os.getenv("PROGRESS_LOG_SECONDS") or 60)
+    STATUS_HOST = os.getenv("STATUS_HOST") or "127.0.0.1"
+    STATUS_PORT = int(os.getenv("STATUS_PORT") or 0)
+
+    # Daemon config
+    DAEMON = os.getenv("DAEMON") == "YES" or args.daemon
+    USAGE_INTERVAL_HOURS = float(os.getenv("USAGE_INTERVAL_HOURS") or 24)
+    ROSTER_INTERVAL_HOURS = float(os.getenv("ROSTER_INTERVAL_HOURS") or 4)
+    COURSEWORK_INTERVAL_HOURS = float(os.getenv("COURSEWORK_INTERVAL_HOURS") or 2)
+    SUBMISSIONS_INTERVAL_HOURS = float(os.getenv("SUBMISSIONS_INTERVAL_HOURS") or 1)
+    MEET_INTERVAL_HOURS = float(os.getenv("MEET_INTERVAL_HOURS") or 1)
 
     # Sync config
     SYNC = os.getenv("SYNC") == "YES" or args.sync
+    SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE") or 100000)
+
+    # Output config
+    SINKS = (os.getenv("SINKS") or "sql").split(",")
+    SINK_OVERRIDES = parse_sink_overrides(os.getenv("SINK_OVERRIDES"))
+    PARQUET_DIR = os.getenv("PARQUET_DIR") or "data/parquet"
+    PARQUET_PARTITION = os.getenv("PARQUET_PARTITION") or "date"
+    PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION") or "snappy"
 
     # Email configuration
     SENDER_EMAIL = os.getenv("SENDER_EMAIL")
@@ -123,12 +203,43 @@ class Config(object):
     TEACHERS_BATCH_SIZE = int(os.getenv("TEACHERS_BATCH_SIZE") or 1000)
     GUARDIANS_BATCH_SIZE = int(os.getenv("GUARDIANS_BATCH_SIZE") or 1000)
     SUBMISSIONS_BATCH_SIZE = int(os.getenv("SUBMISSIONS_BATCH_SIZE") or 120)
+    SUBMISSION_FANOUT_PAGES = int(os.getenv("SUBMISSION_FANOUT_PAGES") or 5)
     GUARDIAN_INVITES_BATCH_SIZE = int(os.getenv("GUARDIAN_INVITES_BATCH_SIZE") or 1000)
     ALIASES_BATCH_SIZE = int(os.getenv("ALIASES_BATCH_SIZE") or 1000)
     INVITATIONS_BATCH_SIZE = int(os.getenv("INVITATIONS_BATCH_SIZE") or 1000)
     ANNOUNCEMENTS_BATCH_SIZE = int(os.getenv("ANNOUNCEMENTS_BATCH_SIZE") or 1000)
     MEET_BATCH_SIZE = int(os.getenv("MEET_BATCH_SIZE") or 1000)
     PAGE_SIZE = int(os.getenv("PAGE_SIZE") or 1000)
+    REQUEST_RETRIES = int(os.getenv("REQUEST_RETRIES") or 5)
+    DISABLE_FIELD_MASKS = os.getenv("DISABLE_FIELD_MASKS") == "YES"
+    MEET_LOOKBACK_HOURS = float(os.getenv("MEET_LOOKBACK_HOURS") or 24)
+    MEET_EVENTS = (os.getenv("MEET_EVENTS") or "call_ended").split(",")
+    MEET_WINDOW_HOURS = float(os.getenv("MEET_WINDOW_HOURS") or 24)
+    MEET_MIN_WINDOW_MINUTES = float(os.getenv("MEET_MIN_WINDOW_MINUTES") or 15)
+    # Filters applied by the API, so discarded data isn't downloaded.
+    COURSE_STATES = parse_list(os.getenv("COURSE_STATES"))
+    COURSE_TEACHER_ID = os.getenv("COURSE_TEACHER_ID")
+    COURSE_STUDENT_ID = os.getenv("COURSE_STUDENT_ID")
+    SUBMISSION_STATES = parse_list(os.getenv("SUBMISSION_STATES"))
+    SUBMISSION_LATE = os.getenv("SUBMISSION_LATE")
+    GUARDIAN_INVITE_STATES = parse_list(
+        os.getenv("GUARDIAN_INVITE_STATES") or "PENDING,COMPLETE"
+    )
+    GUARDIAN_INVITES_SINCE = os.getenv("GUARDIAN_INVITES_SINCE")
+    BUILD_ROLLUPS = os.getenv("BUILD_ROLLUPS") == "YES"
+    NORMALIZE_ROSTERS = os.getenv("NORMALIZE_ROSTERS") == "YES"
+    DEDUPE_MAX_KEYS = int(os.getenv("DEDUPE_MAX_KEYS") or 2000000)
+    HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS") == "YES"
+    HEDGE_TAIL_REQUESTS = int(os.getenv("HEDGE_TAIL_REQUESTS") or 3)
+    HEDGE_MIN_SECONDS = float(os.getenv("HEDGE_MIN_SECONDS") or 5)
+    REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT") or 120)
+
+    # Auto-tuning configuration
+    AUTO_TUNE = os.getenv("AUTO_TUNE") == "YES" or args.autotune
+    MIN_BATCH_SIZE = int(os.getenv("MIN_BATCH_SIZE") or 10)
+    MIN_PAGE_SIZE = int(os.getenv("MIN_PAGE_SIZE") or 100)
+    TARGET_BATCH_SECONDS = float(os.getenv("TARGET_BATCH_SECONDS") or 60)
+    MAX_QUOTA_RATE = float(os.getenv("MAX_QUOTA_RATE") or 0.1)
 
     @classmethod
     def get_args(cls):
@@ -165,10 +276,15 @@ def db_generator(config):
         "pwd": config.DB_PWD,
     }
     if db_type == "mssql":
-        return MSSQL(**default_config)
+        sql = MSSQL(**default_config)
+        configure_pool(sql, config, fast_executemany=True)
     elif db_type == "postgres":
-        return PostgreSQL(**default_config)
+        sql = PostgreSQL(**default_config)
+        configure_pool(sql, config)
     elif db_type == "sqlite":
-        return SQLite(path=config.DB)
+        # SQLite connects to a local file, so it keeps its default pool.
+        sql = SQLite(path=config.DB)
     else:
         raise Exception()
+    sql.pool_stats = PoolStats(sql.engine)
+    return sql
@@ -0,0 +1,51 @@
+import hashlib
+import logging
+
+
+def digest(values):
+    """Hashes a tuple of values into a signed 64 bit integer, to fit a BigInteger."""
+    value_hash = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
+    return int.from_bytes(value_hash, "big", signed=True)
+
+
+class KeySet:
+    """
+    Remembers the natural keys seen during a run, to drop records that arrive twice,
+    like pages received again when a batch is retried. Keys are kept as 64 bit
+    digests rather than tuples of values, and once `max_keys` are held no more are
+    added, so memory stays bounded. Past that point later duplicates are kept rather
+    than risking dropping records that only look alike.
+
+    Parameters:
+        name:       The name of the endpoint, for logging.
+        max_keys:   The most keys to remember.
+    """
+
+    def __init__(self, name, max_keys):
+        self.name = name
+        self.max_keys = max_keys
+        self.digests = set()
+        self.duplicates = 0
+        self.full = False
+
+    def __len__(self):
+        return len(self.digests)
+
+    def _remember(self, key_digest):
+        if len(self.digests) < self.max_keys:
+            self.digests.add(key_digest)
+        elif not self.full:
+            self.full = True
+            logging.info(f"{self.name}: remembering {self.max_keys} keys at most.")
+
+    def filter(self, keys):
+        """Returns whether each key is new, remembering the new ones."""
+        new_keys = []
+        for key in keys:
+            key_digest = digest(key)
+            is_new = key_digest not in self.digests
+            if is_new:
+                self._remember(key_digest)
+            new_keys.append(is_new)
+        self.duplicates += new_keys.count(False)
+        return new_keys
@@ -1,4 +1,5 @@
 from endpoints.announcement import Announcements
+from endpoints.combined import batch_pull_combined
 from endpoints.course import Courses
 from endpoints.course_alias import CourseAliases
 from endpoints.coursework import CourseWork
@@ -12,9 +13,11 @@ from endpoints.submission import StudentSubmissions
 from endpoints.student_usage import StudentUsage
 from endpoints.teacher import Teachers
 from endpoints.topic import Topics
+from endpoints.user import Users
 
 __all__ = [
     "Announcements",
+    "batch_pull_combined",
     "Courses",
     "CourseAliases",
     "CourseWork",
@@ -28,4 +31,5 @@ __all__ = [
     "StudentUsage",
     "Teachers",
     "Topics",
+    "Users",
 ]
@@ -1,3 +1,4 @@
+from column_types import Category, ID, LINK, String
 from endpoints.base import EndPoint
 
 
@@ -17,17 +18,31 @@ class Announcements(EndPoint):
             "assigneeMode",
             "creatorUserId",
         ]
+        self.column_types = {
+            "id": ID,
+            "courseId": ID,
+            "text": String(),
+            "state": Category(),
+            "alternateLink": LINK,
+            "assigneeMode": Category(),
+            "creatorUserId": ID,
+        }
         self.request_key = "announcements"
         self.batch_size = config.ANNOUNCEMENTS_BATCH_SIZE
+        self.indexes = [["courseId"]]
+        self.natural_key = ["id"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.courses()
             .announcements()
             .list(
                 pageToken=next_page_token,
                 courseId=course_id,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
 
@@ -1,19 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import gzip
 import itertools
 import json
 import logging
 import os
+import socket
 import time
 import pandas as pd
+import pyarrow.parquet as pq
 from tenacity import stop_after_attempt, wait_exponential, retry, Retrying
+from sqlalchemy import inspect, Index, text, types
 from sqlalchemy.schema import DropTable
 from sqlalchemy.exc import NoSuchTableError, DataError
 from timer import elapsed
+from column_types import DateTime, String
+from dedupe import KeySet
+from field_mask import build_field_mask
+from hedge import Hedger
+from history import PullHistory
+from profiler import profiled
+from progress import Progress
+from sinks import SINK_TYPES
+from tuner import AutoTuner
 import endpoints
 
 RETRY_PARAMS = {
     "stop": stop_after_attempt(5),
     "wait": wait_exponential(multiplier=1, min=4, max=10),
 }
+DEAD_LETTER_FILE = "data/dead_letters.jsonl"
 
 
 class EndPoint:
@@ -38,13 +54,47 @@ class EndPoint:
         self.service = service
         self.sql = sql
         self.config = config
-        self.filename = f"data/{self.classname().lower()}.json"
+        self.filename = f"data/archive/{self.classname().lower()}.jsonl.gz"
         self.columns = []
         self.date_columns = []
+        # Maps columns to their ColumnType. Undeclared columns are unbounded strings,
+        # or datetimes if they are in `date_columns`.
+        self.column_types = {}
         self.request_key = None
         self.table_name = f"GoogleClassroom_{self.classname()}"
+        # The table batches are inserted into. Overwriting pulls load a staging table
+        # that replaces `table_name` once the pull finishes.
+        self.load_table_name = self.table_name
         # Set to True in a subclass if the API response doesn't include course IDs.
         self.inject_course_id = False
+        # Maps columns built in `preprocess_records` to the response paths they are
+        # derived from. Columns not listed are requested by their own name.
+        self.source_fields = {}
+        # Top level response fields to request alongside the records.
+        self.page_fields = ["nextPageToken"]
+        # Lists of columns to index, built after the table is loaded.
+        self.indexes = []
+        # Rollups of the table, recomputed for the groups each load touches.
+        self.rollups = []
+        # Columns that identify a record. Records whose key was already seen this run,
+        # like those of a page received twice when a batch is retried, are dropped.
+        self.natural_key = None
+        self.seen_keys = None
+        # Set in a subclass whose pulls add to its table rather than replace it, to the
+        # column its requests' dates cover. Its archive only holds the last pull, so
+        # reprocessing only replaces the rows in the dates the archive covers.
+        self.incremental_column = None
+        # Columns to read from the sync source file. None reads every column.
+        self.sync_columns = None
+        self.history = PullHistory(self.classname())
+        self.page_size = config.PAGE_SIZE
+        # Created on the first pull when AUTO_TUNE is set, once batch_size is known.
+        self.tuner = None
+        # Created on the first pull when HEDGE_REQUESTS is set.
+        self.hedger = None
+        self.sinks = []
+        # Set while the archive is reprocessed rather than pulled.
+        self.reprocessing = False
 
     def return_all_data(self):
         """Returns all the data in the associated table"""
@@ -56,13 +106,30 @@ class EndPoint:
             logging.debug(error)
             return None
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         """
         Returns a request object for calling the Google Classroom API for that class.
         Must be overridden by a subclass.
         """
         raise Exception("Request function must be overridden in subclass.")
 
+    def response_fields(self):
+        """
+        Returns a `fields` partial response mask that limits the API response to the
+        paths needed to build `columns`, or None if field masks are disabled.
+        """
+        if self.config.DISABLE_FIELD_MASKS or not self.request_key:
+            return None
+        paths = []
+        for column in self.columns:
+            if column == "courseId" and self.inject_course_id:
+                continue
+            paths.extend(self.source_fields.get(column, [column]))
+        record_paths = [f"{self.request_key}/{path}" for path in paths]
+        return build_field_mask(self.page_fields + record_paths)
+
     def preprocess_records(self, records):
         """
         Any preprocessing that needs to be done to records before they are mapped to
@@ -84,69 +151,253 @@ class EndPoint:
         df = pd.json_normalize(new_records)
         df = df.reindex(columns=self.columns)
         df = self.filter_data(df)
-        df = df.astype("object")
-        df = self._convert_dates(df)
-        return df
+        df = self._convert_types(df)
+        return self._drop_duplicates(df)
+
+    def _value_tuples(self, df, columns):
+        """Returns the values of the columns in each row, with missing values as None."""
+        values = df[columns].astype("object")
+        values = values.where(values.notna(), None)
+        return values.itertuples(index=False, name=None)
+
+    def _key_tuples(self, df):
+        """Returns the natural key of each row."""
+        return self._value_tuples(df, self.natural_key)
+
+    def _drop_duplicates(self, df):
+        """Drops the rows whose natural key was already seen this run."""
+        if not self.natural_key or self.seen_keys is None:
+            return df
+        new_rows = self.seen_keys.filter(self._key_tuples(df))
+        duplicates = len(new_rows) - sum(new_rows)
+        if duplicates:
+            logging.debug(f"{self.classname()}: dropping {duplicates} duplicates.")
+            self.progress.record_duplicates(duplicates)
+        return df.loc[new_rows]
+
+    def _reset_seen_keys(self):
+        self.seen_keys = KeySet(self.classname(), self.config.DEDUPE_MAX_KEYS)
+
+    def column_type(self, column):
+        """Returns the declared ColumnType of a column, or its default."""
+        if column in self.column_types:
+            return self.column_types[column]
+        return DateTime() if column in self.date_columns else String()
+
+    def _convert_types(self, df):
+        """Converts each column to the dtype of its ColumnType."""
+        return df.assign(
+            **{
+                column: self.column_type(column).convert(df[column])
+                for column in df.columns
+            }
+        )
 
-    def _convert_dates(self, df):
-        """Convert date columns to the actual date time."""
-        if self.date_columns:
-            date_types = {col: "datetime64[ns]" for col in self.date_columns}
-            df = df.astype(date_types)
-        return df
+    def _sql_types(self):
+        """Returns the SQL type of each column, used when the table is created."""
+        return {column: self.column_type(column).sql_type for column in self.columns}
 
     @retry(**RETRY_PARAMS)
     def _write_to_db(self, df):
-        """Writes the data into the related table"""
+        """
+        Writes the data into the related table. Each batch is inserted in a single
+        transaction, so a failed write leaves nothing behind to be duplicated when
+        it is retried.
+        """
         logging.debug(
-            f"{self.classname()}: inserting {len(df)} records into {self.table_name}."
+            f"{self.classname()}: inserting {len(df)} records into"
+            f" {self.load_table_name}."
         )
         try:
-            self.sql.insert_into(self.table_name, df, chunksize=10000)
+            self._insert_in_transaction(df, chunksize=10000)
         except DataError:
             # In case of failure, at least upload one-by-one to identify the bad row.
             split_dfs = [df.loc[[i]] for i in df.index]
             for df_small in split_dfs:
                 try:
-                    self.sql.insert_into(self.table_name, df_small)
+                    self._insert_in_transaction(df_small)
                 except DataError as error:
                     pd.set_option("display.max_columns", None)
                     logging.debug(
                         f"{self.classname()}: {error}, unable to upload {df_small}"
                     )
 
+    def _insert_in_transaction(self, df, chunksize=None):
+        with self.sql.engine.begin() as connection:
+            self._insert(connection, df, chunksize)
+
+    def _insert(self, connection, df, chunksize=None):
+        df.to_sql(
+            self.load_table_name,
+            connection,
+            schema=self.sql.schema,
+            if_exists="append",
+            index=False,
+            chunksize=chunksize,
+            dtype=self._sql_types(),
+        )
+
     def _delete_local_file(self):
-        """Deletes the local debug json file in /data."""
+        """Deletes the raw response archive in /data/archive."""
         if os.path.exists(self.filename):
             os.remove(self.filename)
 
-    def _write_json_to_file(self, json_data):
-        """Writes the json data to a debug file in /data."""
-        mode = "a" if os.path.exists(self.filename) else "w"
-        with open(self.filename, mode) as file:
-            file.seek(0)
-            json.dump(json_data, file)
-
-    def _drop_table(self):
+    def _write_json_to_file(self, responses):
+        """
+        Appends the raw responses of a batch to the archive as newline-delimited JSON.
+        Each batch is written as its own gzip member, so a failed run loses at most
+        the batch it was writing and the archive can be read with any gzip reader.
         """
-        Deletes the connected table related to this class.
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with gzip.open(self.filename, "at") as file:
+            for response in responses:
+                file.write(json.dumps(response) + "\n")
+
+    def _read_archive(self):
+        """Yields the archived responses, oldest first."""
+        with gzip.open(self.filename, "rt") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def _drop_table(self, table_name=None):
+        """
+        Deletes the connected table related to this class, or the named table.
         Drops rather than truncates to allow for easy schema changes without migrating.
         """
         try:
-            table = self.sql.table(self.table_name)
+            table = self.sql.table(table_name or self.table_name)
             self.sql.engine.execute(DropTable(table))
         except NoSuchTableError as error:
             logging.debug(f"{error}: Attempted deletion, but no table exists.")
 
-    def _generate_request_id(self, course_id, date, next_page_token, page):
+    def _delete_ranges(self, column, ranges):
+        """Deletes the rows whose column is within any of the (start, end) ranges."""
+        try:
+            table = self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return
+        with self.sql.engine.begin() as connection:
+            for (start, end) in ranges:
+                connection.execute(
+                    table.delete().where(table.c[column].between(start, end))
+                )
+
+    def _start_staging(self):
+        """
+        Loads the rows of an overwriting pull into a staging table, so the existing
+        table stays whole for readers until `_swap_staging` replaces it. Rollups are
+        built into staging tables of their own, and replaced along with it.
+        """
+        self.load_table_name = f"{self.table_name}_Staging"
+        self._drop_table(self.load_table_name)
+        for rollup in self.rollups:
+            rollup.start_staging()
+
+    def _swap_staging(self):
+        """
+        Replaces the table and its rollups with their staging tables in one
+        transaction. Tables without a staging table, since the pull found no rows
+        for them, are dropped.
+        """
+        names = [(self.load_table_name, self.table_name)]
+        names += [
+            (rollup.load_table_name, rollup.table_name) for rollup in self.rollups
+        ]
+        self.load_table_name = self.table_name
+        for rollup in self.rollups:
+            rollup.load_table_name = rollup.table_name
+        swaps = [
+            (self._reflect(staging_name), self._reflect(table_name), table_name)
+            for (staging_name, table_name) in names
+        ]
+        logging.debug(f"{self.classname()}: replacing {self.table_name}.")
+        with self.sql.engine.begin() as connection:
+            for (staging, table, table_name) in swaps:
+                if table is not None:
+                    connection.execute(DropTable(table))
+                if staging is not None:
+                    connection.execute(
+                        text(self._rename_statement(staging, table_name))
+                    )
+
+    def _reflect(self, table_name):
+        """Returns the named table, or None if it doesn't exist."""
+        try:
+            return self.sql.table(table_name)
+        except NoSuchTableError:
+            return None
+
+    def _rename_statement(self, table, table_name):
+        preparer = self.sql.engine.dialect.identifier_preparer
+        if self.sql.engine.dialect.name == "mssql":
+            return f"EXEC sp_rename '{preparer.format_table(table)}', '{table_name}'"
+        return (
+            f"ALTER TABLE {preparer.format_table(table)}"
+            f" RENAME TO {preparer.quote(table_name)}"
+        )
+
+    def _build_indexes(self):
+        """
+        Creates the declared indexes that don't exist yet. Run after loading, since
+        inserting into an indexed table is slower than indexing it once at the end.
+        """
+        try:
+            table = self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return
+        existing = inspect(self.sql.engine).get_indexes(
+            self.table_name, schema=self.sql.schema
+        )
+        existing_names = [index["name"] for index in existing]
+        for columns in self.indexes:
+            name = f"ix_{self.table_name}_{'_'.join(columns)}"[:63]
+            if name in existing_names:
+                continue
+            unbounded = [
+                column for column in columns if self._is_unbounded(table.c[column])
+            ]
+            if unbounded and self.sql.engine.dialect.name == "mssql":
+                # Tables created before their columns were typed, like incremental
+                # ones that are never dropped, may still have text columns, which
+                # MSSQL can't index.
+                logging.info(
+                    f"{self.classname()}: not creating index {name}, since"
+                    f" {', '.join(unbounded)} can't be indexed. Drop the table to"
+                    " recreate it with its declared types."
+                )
+                continue
+            logging.debug(f"{self.classname()}: creating index {name}.")
+            index = Index(name, *[table.c[column] for column in columns])
+            index.create(bind=self.sql.engine)
+
+    def _is_unbounded(self, column):
+        """Whether a column of a reflected table is text without a maximum length."""
+        return isinstance(column.type, types.String) and column.type.length is None
+
+    def _update_statistics(self):
+        """Refreshes the table's statistics so queries are planned for its new size."""
+        dialect = self.sql.engine.dialect.name
+        preparer = self.sql.engine.dialect.identifier_preparer
+        table_name = preparer.format_table(self.sql.table(self.table_name))
+        if dialect == "mssql":
+            statement = f"UPDATE STATISTICS {table_name}"
+        elif dialect in ["postgresql", "sqlite"]:
+            statement = f"ANALYZE {table_name}"
+        else:
+            return
+        with self.sql.engine.begin() as connection:
+            connection.execute(text(statement))
+
+    def _generate_request_id(self, course_id, date, next_page_token, page, page_size):
         """
         Generates a string that can be used as a request_id for batch requesting that
-        contains information on course_id, date, and page number. This is the only
-        method for passing information through a batch request, and allows for
-        paginating by calling the request with the same parameters again.
+        contains information on course_id, date, page number and page size. This is
+        the only method for passing information through a batch request, and allows
+        for paginating by calling the request with the same parameters again.
         NOTE: All request_ids must be unique, so the page number is necessary.
         """
-        return ";".join([str(course_id), str(date), str(next_page_token), str(page)])
+        values = [course_id, date, next_page_token, page, page_size]
+        return ";".join([str(value) for value in values])
 
     def _get_request_info(self, request_id):
         """
@@ -156,141 +407,495 @@ class EndPoint:
 
         values = request_id.split(";")
         cleaned_values = [None if val == "None" else val for val in values]
-        course_id, date, next_page_token, page = cleaned_values
+        course_id, date, next_page_token, page, page_size = cleaned_values
+        page_size = int(page_size) if page_size else None
 
-        return course_id, date, next_page_token, page
+        return course_id, date, next_page_token, page, page_size
 
-    def _generate_request_tuple(self, course_id, date, next_page_token, page):
-        """Generates a tuple with request data and a request ID."""
+    def _history_key(self, course_id, date):
+        """Generates the key a request's page count is recorded under in history."""
+        return ";".join([str(course_id), str(date)])
+
+    def _generate_request_tuple(
+        self, course_id, date, next_page_token, page, page_size=None
+    ):
+        """
+        Generates a tuple with request data and a request ID. A page token is only
+        valid for a request otherwise identical to the one that returned it, so pages
+        after the first keep the page size of their first page. Only first pages use
+        the page size tuned since.
+        """
+        if next_page_token is None or page_size is None:
+            page_size = self.page_size
         return (
-            self.request_data(course_id, date, next_page_token),
-            self._generate_request_id(course_id, date, next_page_token, page),
+            self.request_data(course_id, date, next_page_token, page_size),
+            self._generate_request_id(
+                course_id, date, next_page_token, page, page_size
+            ),
         )
 
-    def _execute_batch_with_retry(self, batch):
-        """Executes the passed in batch, with retry logi when not in debug."""
+    def _execute_batch_with_retry(self, requests, callback):
+        """
+        Executes the requests in a batch, with retry logic when not in debug.
+        When the batch call fails, only the requests that haven't completed yet are
+        sent again. Returns True if any attempt timed out.
+
+        Parameters:
+            requests:   A list of (request, request_id) tuples.
+            callback:   The callback to pass each response to.
+        """
+        if self.hedger and len(requests) <= self.config.HEDGE_TAIL_REQUESTS:
+            return self._execute_hedged(requests, callback)
+        pending = {request_id: request for (request, request_id) in requests}
+        timeouts = []
+
+        def tracked_callback(request_id, response, exception):
+            pending.pop(request_id, None)
+            callback(request_id, response, exception)
+
+        def execute():
+            batch = self.service.new_batch_http_request(callback=tracked_callback)
+            for (request_id, request) in list(pending.items()):
+                batch.add(request, request_id=request_id)
+            try:
+                batch.execute()
+            except socket.timeout:
+                timeouts.append(True)
+                raise
+
         if self.config.DEBUG:
-            batch.execute()
+            execute()
         else:
             retryer = Retrying(**RETRY_PARAMS)
-            retryer(batch.execute)
+            retryer(execute)
+        return len(timeouts) > 0
 
-    @elapsed
-    def batch_pull_data(self, course_ids=[None], dates=[None], overwrite=True):
+    def _execute_hedged(self, requests, callback):
+        """
+        Executes the few requests at the tail of a pull side by side instead of as a
+        batch, hedging stragglers. Responses are passed to the callback in order, as
+        a batch would. Returns True if any request timed out.
         """
-        Executes the API request in batches based on the courses and dates, writing
-        results as they come in to the DB, and returning the cumulative results.
 
-        Parameters:
-            course_ids: A list of courses that will each get a separate request.
-            dates:      A list of dates that will each get a separate request.
-            overwite:   If True, drops and overwrites the existing database.
+        def execute(request_tuple):
+            try:
+                return (self.hedger.execute(request_tuple[0]), None)
+            # Any error goes to the callback, which retries or dead letters it.
+            except Exception as error:
+                return (None, error)
+
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            results = list(executor.map(execute, requests))
+        timed_out = False
+        for ((_, request_id), (response, error)) in zip(requests, results):
+            timed_out = timed_out or isinstance(error, socket.timeout)
+            callback(request_id, response, error)
+        return timed_out
+
+    def _build_sinks(self):
+        """Creates the sinks this endpoint writes to, from SINKS or SINK_OVERRIDES."""
+        names = self.config.SINK_OVERRIDES.get(self.classname(), self.config.SINKS)
+        return [SINK_TYPES[name.strip()](self, self.config) for name in names]
+
+    def _record_batch(self, seconds, request_ids, timed_out):
+        """
+        Records the outcome of a batch in history and tunes the next batch. Requests
+        in a batch come back together, so each is counted as an equal share of the
+        batch's time toward the latency of its key.
         """
+        requests = len(request_ids)
+        self.history.record_batch(seconds, requests)
+        for request_id in request_ids:
+            course_id, date, _, _, _ = self._get_request_info(request_id)
+            key = self._history_key(course_id, date)
+            self.history.record_seconds(key, seconds / requests)
+        if self.tuner:
+            self.tuner.observe(seconds, requests, self.quota_errors, timed_out)
+            self.batch_size = self.tuner.batch_size
+            self.page_size = self.tuner.page_size
+        self.quota_errors = 0
+
+    def _start_pull(self, course_ids, dates, overwrite):
+        """Resets the state of the pull and queues the first page of each request."""
+        self.sinks = self._build_sinks()
         if overwrite:
-            self._drop_table()
+            for sink in self.sinks:
+                sink.reset()
 
         if self.config.DEBUGFILE:
             self._delete_local_file()
 
-        batch_data = []
-        quota_exceeded = False
-        remaining_requests = []
-
-        def callback(request_id, response, exception):
-            """A local callback for batch requests when they have completed."""
-            course_id, date, next_page_token, page = self._get_request_info(request_id)
-
-            if exception:
-                status = exception.resp.status
-                # 429: Quota exceeded.
-                # Add the original request back to retry later.
-                if status == 429:
-                    same_request = self._generate_request_tuple(
-                        course_id, date, next_page_token, page
-                    )
-                    remaining_requests.append(same_request)
-                    nonlocal quota_exceeded
-                    if not quota_exceeded:
-                        # Only log once to avoid spaminess.
-                        logging.debug(exception)
-                    quota_exceeded = True
-                return
-
-            if "warnings" in response:
-                for warning in response["warnings"]:
-                    logging.debug(f"{warning['code']}: {warning['message']}")
-                    if warning["code"] == "PARTIAL_DATA_AVAILABLE":
-                        for item in warning["data"]:
-                            key = item["key"]
-                            value = item["value"]
-                            if key == "application" and value == "classroom":
-                                logging.debug("Ignoring responses with partial data.")
-                                return
-
-            if "nextPageToken" in response:
-                logging_string = f"{self.classname()}: Queueing next page"
-                logging_string += f" from course {course_id}." if course_id else "."
-                logging.debug(logging_string)
-                next_request = self._generate_request_tuple(
-                    course_id, date, response["nextPageToken"], int(page) + 1
-                )
-                remaining_requests.append(next_request)
-
-            records = response.get(self.request_key, [])
-            logging_string = f"{self.classname()}: received {len(records)} records"
-            logging_string += f", course {course_id}" if course_id else ""
-            logging_string += f", date {date}" if date else ""
-            logging_string += f", page {page}" if page else ""
-            logging_string += "."
-            logging.debug(logging_string)
-
-            if self.inject_course_id:
-                for record in records:
-                    record["courseId"] = course_id
-
-            nonlocal batch_data
-            batch_data.extend(records)
+        if self.config.AUTO_TUNE and self.tuner is None:
+            self.tuner = AutoTuner(
+                self.classname(),
+                self.history,
+                self.batch_size,
+                self.page_size,
+                self.config,
+            )
+            self.batch_size = self.tuner.batch_size
+            self.page_size = self.tuner.page_size
+
+        # Cassettes record and replay batches, so requests aren't hedged with them.
+        cassette = self.config.RECORD_CASSETTE or self.config.REPLAY_CASSETTE
+        if self.config.HEDGE_REQUESTS and not cassette:
+            self.hedger = self.hedger or Hedger(self.classname(), self.config)
+            self.hedger.start()
+
+        self.batch_data = []
+        # Raw responses of the current batch, kept for the archive.
+        self.batch_responses = []
+        self._reset_seen_keys()
+        self.quota_exceeded = False
+        self.quota_errors = 0
+        self.remaining_requests = []
+        # Requests waiting out their backoff, as (ready time, request tuple) pairs.
+        self.delayed_requests = []
+        self.request_attempts = {}
+        self.dead_letters = []
 
         logging.info(f"{self.classname()}: Generating requests...")
         request_combinations = list(itertools.product(course_ids, dates))
         # Reverses because the items are taken in order from the back by popping.
         request_combinations.reverse()
+        # Requests that took the most pages last run are popped first, so their
+        # remaining pages overlap with the rest of the work instead of forming a
+        # long tail at the end. The sort is stable, so ties keep their order.
+        request_combinations.sort(
+            key=lambda combination: self.history.expected_pages(
+                self._history_key(*combination)
+            )
+        )
         for (course_id, date) in request_combinations:
             request_tuple = self._generate_request_tuple(course_id, date, None, 0)
-            remaining_requests.append(request_tuple)
+            self.remaining_requests.append(request_tuple)
 
-        while len(remaining_requests) > 0:
-            log = f"{self.classname()}: {len(remaining_requests)} requests remaining."
-            if len(remaining_requests) == 1:
-                _, _, _, page = self._get_request_info(remaining_requests[0][1])
-                log += f" On page {page}."
-            logging.info(log)
+        self.progress = Progress(self.classname(), self.history, self.config)
+        self.progress.start(
+            [self._history_key(*combination) for combination in request_combinations]
+        )
+
+    def _handle_response(self, request_id, response, exception):
+        """A callback for batch requests when they have completed."""
+        course_id, date, next_page_token, page, page_size = self._get_request_info(
+            request_id
+        )
+
+        if exception:
+            status = getattr(getattr(exception, "resp", None), "status", None)
+            # 429: Quota exceeded.
+            # Add the original request back to retry later.
+            if status == 429:
+                same_request = self._generate_request_tuple(
+                    course_id, date, next_page_token, page, page_size
+                )
+                self.remaining_requests.append(same_request)
+                self.quota_errors += 1
+                if self.hedger:
+                    # Hedges would use up more of the quota.
+                    self.hedger.disable()
+                if not self.quota_exceeded:
+                    # Only log once to avoid spaminess.
+                    logging.debug(exception)
+                self.quota_exceeded = True
+            # Server errors and timeouts are retried with a backoff per request.
+            elif self._is_retryable(status) and self._retry_later(request_id):
+                logging.debug(f"{self.classname()}: retrying {request_id}, {exception}")
+            # Anything else, like a 404 on a deleted course, won't succeed later.
+            else:
+                self._dead_letter(request_id, status, exception)
+                self.progress.record_failure()
+            return
+
+        if "warnings" in response:
+            for warning in response["warnings"]:
+                logging.debug(f"{warning['code']}: {warning['message']}")
+                if warning["code"] == "PARTIAL_DATA_AVAILABLE":
+                    for item in warning["data"]:
+                        key = item["key"]
+                        value = item["value"]
+                        if key == "application" and value == "classroom":
+                            logging.debug("Ignoring responses with partial data.")
+                            return
+
+        self.history.record_page(self._history_key(course_id, date), page)
+
+        if "nextPageToken" in response:
+            logging_string = f"{self.classname()}: Queueing next page"
+            logging_string += f" from course {course_id}." if course_id else "."
+            logging.debug(logging_string)
+            next_request = self._generate_request_tuple(
+                course_id, date, response["nextPageToken"], int(page) + 1, page_size
+            )
+            self.remaining_requests.append(next_request)
+
+        records = response.get(self.request_key, [])
+        if self.config.DEBUGFILE:
+            self.batch_responses.append(
+                {
+                    "request_id": request_id,
+                    "course_id": course_id,
+                    "date": date,
+                    "page": page,
+                    "received": datetime.now().isoformat(),
+                    "records": records,
+                }
+            )
+        logging_string = f"{self.classname()}: received {len(records)} records"
+        logging_string += f", course {course_id}" if course_id else ""
+        logging_string += f", date {date}" if date else ""
+        logging_string += f", page {page}" if page else ""
+        logging_string += "."
+        logging.debug(logging_string)
+
+        if self.inject_course_id:
+            for record in records:
+                record["courseId"] = course_id
+
+        self.batch_data.extend(records)
+        self.progress.record_response(len(records), "nextPageToken" in response)
+
+    def _is_retryable(self, status):
+        """Whether a failed request with the given status may succeed if retried."""
+        return status is None or status == 408 or status >= 500
+
+    def _retry_later(self, request_id):
+        """
+        Queues the request again after an exponential backoff. Returns False if the
+        request is out of attempts.
+        """
+        attempts = self.request_attempts.get(request_id, 0) + 1
+        if attempts > self.config.REQUEST_RETRIES:
+            return False
+        self.request_attempts[request_id] = attempts
+        course_id, date, next_page_token, page, page_size = self._get_request_info(
+            request_id
+        )
+        same_request = self._generate_request_tuple(
+            course_id, date, next_page_token, page, page_size
+        )
+        ready_time = time.time() + min(60, 4 * 2 ** (attempts - 1))
+        self.delayed_requests.append((ready_time, same_request))
+        return True
+
+    def _release_delayed_requests(self, now=None):
+        """Moves delayed requests whose backoff has passed into remaining requests."""
+        now = now or time.time()
+        ready = [
+            request
+            for (ready_time, request) in self.delayed_requests
+            if ready_time <= now
+        ]
+        self.delayed_requests = [
+            (ready_time, request)
+            for (ready_time, request) in self.delayed_requests
+            if ready_time > now
+        ]
+        self.remaining_requests.extend(ready)
+
+    def _next_ready_time(self):
+        """Returns the time the first delayed request is ready to be retried."""
+        return min([ready_time for (ready_time, _) in self.delayed_requests])
+
+    def _wait_for_delayed_requests(self):
+        """Sleeps until the first delayed request is ready, then releases it."""
+        ready_time = self._next_ready_time()
+        time.sleep(max(0, ready_time - time.time()))
+        self._release_delayed_requests(ready_time)
+
+    def _dead_letter(self, request_id, status, exception):
+        """Records a request that failed permanently in the dead letter file."""
+        course_id, date, _, page, _ = self._get_request_info(request_id)
+        entry = {
+            "time": datetime.now().isoformat(),
+            "endpoint": self.classname(),
+            "course_id": course_id,
+            "date": date,
+            "page": page,
+            "status": status,
+            "reason": str(exception),
+        }
+        self.dead_letters.append(entry)
+        if self.config.REPLAY_CASSETTE:
+            # Replayed failures were recorded, and dead lettered, when they happened.
+            logging.info(
+                f"{self.classname()}: replayed request {request_id} failed with"
+                f" status {status}."
+            )
+            return
+        logging.info(
+            f"{self.classname()}: request {request_id} failed with status {status}."
+            f" Adding it to {DEAD_LETTER_FILE}."
+        )
+        with open(DEAD_LETTER_FILE, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+
+    def _log_remaining_requests(self):
+        """Logs how many requests are left, and the page when only one is left."""
+        log = f"{self.classname()}: {len(self.remaining_requests)} requests remaining."
+        if len(self.remaining_requests) == 1:
+            _, _, _, page, _ = self._get_request_info(self.remaining_requests[0][1])
+            log += f" On page {page}."
+        logging.info(log)
+        self.progress.log_if_due()
+
+    def _process_batch_data(self):
+        """Processes the records received in the last batch and writes them."""
+        if self.batch_responses:
+            self._write_json_to_file(self.batch_responses)
+            self.batch_responses = []
+        if len(self.batch_data) > 0:
+            df = self._process_and_filter_records(self.batch_data)
+            for sink in self.sinks:
+                sink.write(df)
+            self.batch_data = []
+
+    @elapsed
+    @profiled
+    def batch_pull_data(self, course_ids=[None], dates=[None], overwrite=True):
+        """
+        Executes the API request in batches based on the courses and dates, writing
+        results as they come in to each of the endpoint's sinks.
+
+        Parameters:
+            course_ids: A list of courses that will each get a separate request.
+            dates:      A list of dates that will each get a separate request.
+            overwite:   If True, drops and overwrites the existing database.
+        """
+        self._start_pull(course_ids, dates, overwrite)
+
+        while len(self.remaining_requests) > 0 or len(self.delayed_requests) > 0:
+            self._release_delayed_requests()
+            if len(self.remaining_requests) == 0:
+                # Only retries waiting out their backoff are left.
+                self._wait_for_delayed_requests()
+            self._log_remaining_requests()
 
             # Load up a new batch with requests from remaining requests
-            batch = self.service.new_batch_http_request(callback=callback)
-            current_batch = 0
-            while len(remaining_requests) > 0 and current_batch < self.batch_size:
-                current_batch += 1
-                (request, request_id) = remaining_requests.pop()
-                batch.add(request, request_id=request_id)
-            self._execute_batch_with_retry(batch)
+            requests = []
+            while len(self.remaining_requests) > 0 and len(requests) < self.batch_size:
+                requests.append(self.remaining_requests.pop())
+            start = time.time()
+            timed_out = self._execute_batch_with_retry(requests, self._handle_response)
+            request_ids = [request_id for (_, request_id) in requests]
+            self._record_batch(time.time() - start, request_ids, timed_out)
 
             # Process the results of the batch.
-            if len(batch_data) > 0:
-                if self.config.DEBUGFILE:
-                    self._write_json_to_file(batch_data)
-                df = self._process_and_filter_records(batch_data)
-                self._write_to_db(df)
-                batch_data = []
+            self._process_batch_data()
 
             # Pause if quota exceeded. 20s because the quota is a sliding time window.
-            if quota_exceeded:
-                quota_exceeded = False
+            if self.quota_exceeded:
+                self.quota_exceeded = False
                 logging.info(
                     f"{self.classname()}: Quota exceeded. Pausing for 20 seconds..."
                 )
                 time.sleep(20)
 
+        self._finish_pull()
+
+    @elapsed
+    def reprocess_archive(self):
+        """
+        Rebuilds the endpoint's output from the raw response archive instead of the
+        API, so processing changes can be backfilled without any requests. Responses
+        are processed in groups of `batch_size`, like a pull.
+        """
+        if not os.path.exists(self.filename):
+            logging.info(f"{self.classname()}: no archive at {self.filename}.")
+            return
+        logging.info(f"{self.classname()}: Reprocessing {self.filename}...")
+        self.reprocessing = True
+        try:
+            self._reprocess_responses()
+        finally:
+            self.reprocessing = False
+
+    def _reprocess_responses(self):
+        self.sinks = self._build_sinks()
+        ranges = self._archive_ranges() if self.incremental_column else None
+        if not self._reset_sinks(ranges):
+            return
+        self.batch_data = []
+        self.batch_responses = []
+        self._reset_seen_keys()
+        self.progress = Progress(self.classname(), self.history, self.config)
+        responses = 0
+        for response in self._read_archive():
+            records = response["records"]
+            if self.inject_course_id:
+                for record in records:
+                    record["courseId"] = response["course_id"]
+            self.batch_data.extend(records)
+            responses += 1
+            if responses % self.batch_size == 0:
+                self._process_batch_data()
+        self._process_batch_data()
+        for sink in self.sinks:
+            sink.close()
+        logging.info(
+            f"{self.classname()}: Reprocessed {responses} responses,"
+            f" dropped {self.progress.duplicates} duplicates."
+        )
+
+    def _request_range(self, date):
+        """Returns the first and last values of `incremental_column` a date requests."""
+        day = datetime.strptime(date, "%Y-%m-%d")
+        return (day, day)
+
+    def _archive_ranges(self):
+        """Returns the ranges requested by the archived pull, merged where they meet."""
+        dates = {response["date"] for response in self._read_archive()}
+        ranges = sorted([self._request_range(date) for date in dates if date])
+        merged = []
+        for (start, end) in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _reset_sinks(self, ranges=None):
+        """
+        Clears the output the archive is reprocessed into: all of it, or only the rows
+        within the ranges if given. Returns False if a sink can't clear only part of
+        its output, in which case nothing is cleared.
+        """
+        if ranges is None:
+            for sink in self.sinks:
+                sink.reset()
+            return True
+        if not self._can_reset_ranges():
+            return False
+        for sink in self.sinks:
+            sink.reset_ranges(self.incremental_column, ranges)
+        return True
+
+    def _can_reset_ranges(self):
+        """Whether every sink can clear only part of its output. Logs those that can't."""
+        unsupported = [sink for sink in self.sinks if not hasattr(sink, "reset_ranges")]
+        if unsupported:
+            names = ", ".join([type(sink).__name__ for sink in unsupported])
+            logging.info(
+                f"{self.classname()}: {names} can't replace part of the output,"
+                " so the archive isn't reprocessed."
+            )
+            return False
+        return True
+
+    def _finish_pull(self):
+        """Saves the history of the pull and reports its progress and failures."""
+        self.history.save()
+        for sink in self.sinks:
+            sink.close()
+        self.progress.finish()
+        if self.hedger:
+            logging.info(self.hedger.summary())
+        if self.dead_letters:
+            logging.info(
+                f"{self.classname()}: {len(self.dead_letters)} requests failed"
+                f" permanently. See {DEAD_LETTER_FILE}."
+            )
+
     def differences_between_frames(self, df1, df2, left_on, right_on):
         """
         Merges two dataframes and splits them by which one a row comes from.
@@ -327,21 +932,73 @@ class EndPoint:
         """
         return self.return_all_data().astype("str")
 
+    def _sync_file_path(self):
+        """
+        Returns the path of the sync source file for this class, checking for CSV,
+        gzip-compressed CSV and Parquet files in that order.
+        """
+        basename = f"sync_files/{self.classname().lower()}"
+        for extension in [".csv", ".csv.gz", ".parquet"]:
+            path = f"{basename}{extension}"
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"No sync file found for {basename}.")
+
+    def _read_sync_chunks(self, path):
+        """
+        Yields the sync source file in chunks of SYNC_CHUNK_SIZE rows, reading only
+        `sync_columns`, so memory is proportional to a chunk rather than the file.
+        """
+        chunksize = self.config.SYNC_CHUNK_SIZE
+        if path.endswith(".parquet"):
+            parquet_file = pq.ParquetFile(path)
+            batches = parquet_file.iter_batches(
+                batch_size=chunksize, columns=self.sync_columns
+            )
+            for batch in batches:
+                yield batch.to_pandas().astype("str")
+        else:
+            reader = pd.read_csv(
+                path,
+                usecols=self.sync_columns,
+                dtype="str",
+                chunksize=chunksize,
+                compression="infer",
+            )
+            for chunk in reader:
+                yield chunk.astype("str")
+
     def sync_data(self, data=None):
+        """
+        Compares the sync source against the database, returning the rows that need
+        to be created and deleted in Google Classroom.
+
+        Parameters:
+            data:   A dataframe to use as the source. If None, the sync file is read
+                    from /sync_files in chunks.
+        """
         if data is None:
-            csv_name = f"{self.classname().lower()}.csv"
-            data = pd.read_csv(f"sync_files/{csv_name}").astype("str")
+            chunks = self._read_sync_chunks(self._sync_file_path())
+        else:
+            chunks = [data]
         db_df = self.return_cleaned_sync_data()
         aliases = endpoints.CourseAliases(self.service, self.sql, self.config)
         alias_df = aliases.return_cleaned_sync_data()
         db_df = pd.merge(
             db_df, alias_df, left_on="courseId", right_on="courseId", how="inner"
         )
-        data["alias"] = "d:" + data["alias"]
 
-        (left_only, right_only, _) = self.differences_between_frames(
-            data, db_df, "alias", "alias"
-        )
-        to_create = data[data.alias.isin(left_only.alias)].reset_index(drop=True)
-        to_delete = db_df[db_df.alias.isin(right_only.alias)].reset_index(drop=True)
+        # Only the new rows of each chunk and the set of seen aliases are kept.
+        created_chunks = []
+        source_aliases = set()
+        for chunk in chunks:
+            chunk["alias"] = "d:" + chunk["alias"]
+            source_aliases.update(chunk["alias"])
+            created_chunks.append(chunk[~chunk["alias"].isin(db_df["alias"])])
+
+        if created_chunks:
+            to_create = pd.concat(created_chunks).reset_index(drop=True)
+        else:
+            to_create = pd.DataFrame(columns=self.sync_columns)
+        to_delete = db_df[~db_df["alias"].isin(source_aliases)].reset_index(drop=True)
         return (to_create, to_delete)
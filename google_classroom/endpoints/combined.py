@@ -0,0 +1,84 @@
+import logging
+import time
+
+from timer import elapsed
+
+
+@elapsed
+def batch_pull_combined(endpoints, course_ids, overwrite=True):
+    """
+    Pulls several per-course endpoints together, packing their requests into shared
+    batch HTTP calls. Google batch requests can mix methods, so each request ID is
+    prefixed with its endpoint's name and the response is routed back to that
+    endpoint's callback and processing. The endpoints must share one service.
+
+    Parameters:
+        endpoints:  A list of endpoint instances to pull from.
+        course_ids: A list of courses that will each get a separate request.
+        overwite:   If True, drops and overwrites the existing databases.
+    """
+    endpoints_by_name = {endpoint.classname(): endpoint for endpoint in endpoints}
+    for endpoint in endpoints:
+        endpoint._start_pull(course_ids, [None], overwrite)
+
+    def callback(request_id, response, exception):
+        """Routes the response to the callback of the endpoint that requested it."""
+        name, endpoint_request_id = request_id.split(":", 1)
+        endpoints_by_name[name]._handle_response(
+            endpoint_request_id, response, exception
+        )
+
+    def remaining_endpoints():
+        return [endpoint for endpoint in endpoints if endpoint.remaining_requests]
+
+    def delayed_endpoints():
+        return [endpoint for endpoint in endpoints if endpoint.delayed_requests]
+
+    while len(remaining_endpoints()) > 0 or len(delayed_endpoints()) > 0:
+        for endpoint in delayed_endpoints():
+            endpoint._release_delayed_requests()
+        if len(remaining_endpoints()) == 0:
+            # Only retries waiting out their backoff are left.
+            first_ready = min(
+                delayed_endpoints(), key=lambda endpoint: endpoint._next_ready_time()
+            )
+            first_ready._wait_for_delayed_requests()
+        for endpoint in remaining_endpoints():
+            endpoint._log_remaining_requests()
+
+        # Fill the batch by taking a request from each endpoint in turn.
+        # The smallest batch size keeps heavier endpoints within their limits.
+        batch_size = min([endpoint.batch_size for endpoint in endpoints])
+        requests = []
+        request_ids = {name: [] for name in endpoints_by_name}
+        while len(remaining_endpoints()) > 0 and len(requests) < batch_size:
+            for endpoint in remaining_endpoints():
+                if len(requests) >= batch_size:
+                    break
+                (request, request_id) = endpoint.remaining_requests.pop()
+                requests.append((request, f"{endpoint.classname()}:{request_id}"))
+                request_ids[endpoint.classname()].append(request_id)
+        start = time.time()
+        timed_out = endpoints[0]._execute_batch_with_retry(requests, callback)
+        seconds = time.time() - start
+        # Each endpoint is tuned on its own requests and their share of the batch's
+        # time, so its sizes don't react to the other endpoints' traffic.
+        for endpoint in endpoints:
+            endpoint_request_ids = request_ids[endpoint.classname()]
+            share = (
+                seconds * len(endpoint_request_ids) / len(requests) if requests else 0
+            )
+            endpoint._record_batch(share, endpoint_request_ids, timed_out)
+
+        for endpoint in endpoints:
+            endpoint._process_batch_data()
+
+        # Pause if quota exceeded. 20s because the quota is a sliding time window.
+        if any([endpoint.quota_exceeded for endpoint in endpoints]):
+            for endpoint in endpoints:
+                endpoint.quota_exceeded = False
+            logging.info("Combined pull: Quota exceeded. Pausing for 20 seconds...")
+            time.sleep(20)
+
+    for endpoint in endpoints:
+        endpoint._finish_pull()
@@ -1,3 +1,4 @@
+from column_types import Boolean, Category, EMAIL, ID, String
 from endpoints.base import EndPoint
 
 
@@ -22,13 +23,42 @@ class Courses(EndPoint):
             "updateTime",
             "calendarId",
         ]
+        self.column_types = {
+            "id": ID,
+            # Classroom allows longer names, rooms and sections than other names.
+            "name": String(750),
+            "courseGroupEmail": EMAIL,
+            "courseState": Category(),
+            "description": String(),
+            "descriptionHeading": String(),
+            "enrollmentCode": ID,
+            "guardiansEnabled": Boolean(),
+            "ownerId": ID,
+            "room": String(650),
+            "section": String(2800),
+            "teacherGroupEmail": EMAIL,
+            "calendarId": EMAIL,
+        }
         self.request_key = "courses"
         self.batch_size = config.COURSES_BATCH_SIZE
+        self.indexes = [["id"]]
+        self.natural_key = ["id"]
+        self.sync_columns = ["alias", "name", "section", "teacher_email"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
+        """
+        Requests courses, filtered by the API to COURSE_STATES and to the courses of
+        COURSE_TEACHER_ID or COURSE_STUDENT_ID when they are set.
+        """
         return self.service.courses().list(
+            courseStates=self.config.COURSE_STATES,
+            teacherId=self.config.COURSE_TEACHER_ID,
+            studentId=self.config.COURSE_STUDENT_ID,
             pageToken=next_page_token,
-            pageSize=self.config.PAGE_SIZE,
+            pageSize=page_size,
+            fields=self.response_fields(),
         )
 
     def filter_data(self, dataframe):
@@ -1,3 +1,4 @@
+from column_types import ID, NAME
 from endpoints.base import EndPoint
 
 
@@ -5,17 +6,23 @@ class CourseAliases(EndPoint):
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.columns = ["courseId", "alias"]
+        self.column_types = {"courseId": ID, "alias": NAME}
         self.request_key = "aliases"
         self.batch_size = config.ALIASES_BATCH_SIZE
+        self.indexes = [["courseId"]]
+        self.natural_key = ["courseId", "alias"]
         self.inject_course_id = True
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.courses()
             .aliases()
             .list(
                 pageToken=next_page_token,
                 courseId=course_id,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
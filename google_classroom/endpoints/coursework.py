@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from column_types import Category, Float, ID, LINK, String
 from endpoints.base import EndPoint
 
 
@@ -24,16 +25,36 @@ class CourseWork(EndPoint):
             "creatorUserId",
             "topicId",
         ]
+        self.column_types = {
+            "courseId": ID,
+            "id": ID,
+            "title": String(3000),
+            "description": String(),
+            "state": Category(),
+            "alternateLink": LINK,
+            "maxPoints": Float(),
+            "workType": Category(),
+            "assigneeMode": Category(),
+            "submissionModificationMode": Category(),
+            "creatorUserId": ID,
+            "topicId": ID,
+        }
+        self.source_fields = {"dueDate": ["dueDate", "dueTime"]}
         self.request_key = "courseWork"
         self.batch_size = config.COURSEWORK_BATCH_SIZE
+        self.indexes = [["courseId"], ["id"]]
+        self.natural_key = ["id"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.courses()
             .courseWork()
             .list(
                 courseId=course_id,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
                 pageToken=next_page_token,
             )
         )
@@ -1,3 +1,4 @@
+from column_types import EMAIL, ID
 from endpoints.base import EndPoint
 
 
@@ -5,14 +6,26 @@ class Guardians(EndPoint):
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.columns = ["studentId", "guardianId", "invitedEmailAddress"]
+        self.column_types = {
+            "studentId": ID,
+            "guardianId": ID,
+            "invitedEmailAddress": EMAIL,
+        }
         self.request_key = "guardians"
         self.batch_size = config.GUARDIANS_BATCH_SIZE
+        self.indexes = [["studentId"]]
+        self.natural_key = ["studentId", "guardianId"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.userProfiles()
             .guardians()
             .list(
-                studentId="-", pageToken=next_page_token, pageSize=self.config.PAGE_SIZE
+                studentId="-",
+                pageToken=next_page_token,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
@@ -1,3 +1,4 @@
+from column_types import Category, EMAIL, ID
 from endpoints.base import EndPoint
 
 
@@ -12,17 +13,38 @@ class GuardianInvites(EndPoint):
             "state",
             "creationTime",
         ]
+        self.column_types = {
+            "studentId": ID,
+            "invitationId": ID,
+            "invitedEmailAddress": EMAIL,
+            "state": Category(),
+        }
         self.request_key = "guardianInvitations"
         self.batch_size = config.GUARDIAN_INVITES_BATCH_SIZE
+        self.indexes = [["studentId"]]
+        self.natural_key = ["studentId", "invitationId"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.userProfiles()
             .guardianInvitations()
             .list(
                 studentId="-",
-                states=["PENDING", "COMPLETE"],
+                states=self.config.GUARDIAN_INVITE_STATES,
                 pageToken=next_page_token,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
+
+    def filter_data(self, dataframe):
+        """
+        Drops invites created before GUARDIAN_INVITES_SINCE. The API has no date
+        filter, so this is the only filter not applied before download.
+        """
+        if self.config.GUARDIAN_INVITES_SINCE:
+            since = self.config.GUARDIAN_INVITES_SINCE
+            return dataframe[dataframe.creationTime >= since]
+        return dataframe
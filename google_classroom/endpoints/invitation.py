@@ -1,3 +1,4 @@
+from column_types import Category, ID
 from endpoints.base import EndPoint
 
 
@@ -5,12 +6,23 @@ class Invitations(EndPoint):
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.columns = ["id", "userId", "courseId", "role"]
+        self.column_types = {
+            "id": ID,
+            "userId": ID,
+            "courseId": ID,
+            "role": Category(),
+        }
         self.request_key = "invitations"
         self.batch_size = config.INVITATIONS_BATCH_SIZE
+        self.indexes = [["courseId"], ["userId"]]
+        self.natural_key = ["id"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return self.service.invitations().list(
             pageToken=next_page_token,
             courseId=course_id,
-            pageSize=self.config.PAGE_SIZE,
+            pageSize=page_size,
+            fields=self.response_fields(),
         )
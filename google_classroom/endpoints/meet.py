@@ -1,9 +1,31 @@
+from column_types import Boolean, Category, EMAIL, ID, Integer, NAME, String
 from endpoints.base import EndPoint
-from datetime import timedelta
+from datetime import datetime, timedelta
+import json
 import logging
+import os
+
+import pandas as pd
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.dialects import mssql
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.schema import DropIndex
+
+from sql_chunks import CHUNK_SIZE, chunks
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+# Report parameters hold their value in one of these, depending on its type.
+VALUE_KEYS = ["value", "intValue", "boolValue", "multiValue"]
 
 
 class Meet(EndPoint):
+    """
+    Google Meet call_ended events. Other events set in MEET_EVENTS are fetched by the
+    same requests and written to their own tables by MeetEvent endpoints.
+    """
+
+    event_name = "call_ended"
+
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.date_columns = ["item_time"]
@@ -22,58 +44,406 @@ class Meet(EndPoint):
             "item_time",
             "event_name",
         ]
+        self.column_types = {
+            "conference_id": ID,
+            "device_type": Category(),
+            "display_name": NAME,
+            "duration_seconds": Integer(),
+            "endpoint_id": ID,
+            "identifier": EMAIL,
+            "identifier_type": Category(),
+            "ip_address": String(64),
+            "is_external": Boolean(),
+            "meeting_code": ID,
+            "organizer_email": EMAIL,
+            "event_name": Category(),
+        }
+        parameter_fields = [
+            "events/parameters/name",
+            "events/parameters/value",
+            "events/parameters/intValue",
+            "events/parameters/boolValue",
+            "events/parameters/multiValue",
+        ]
+        self.source_fields = {column: parameter_fields for column in self.columns}
+        self.source_fields["item_time"] = ["id/time"]
+        self.source_fields["event_name"] = ["events/name"]
         self.request_key = "items"
         self.batch_size = config.MEET_BATCH_SIZE
+        self.indexes = [["item_time"], ["conference_id"]]
+        # Identifies an event, so events pulled again by the lookback replace the
+        # stored ones instead of being stored twice.
+        self.natural_key = ["conference_id", "endpoint_id", "identifier", "item_time"]
+        self.incremental_column = "item_time"
+        self.last_date = None
+        # The time of the latest event stored before the pull. Only events up to then
+        # can be stored already.
+        self.stored_until = None
+        self.event_endpoints = self._build_event_endpoints()
+
+    def _build_event_endpoints(self):
+        return [
+            MeetEvent.for_event(event_name)(self.service, self.sql, self.config)
+            for event_name in self.config.MEET_EVENTS
+            if event_name != self.event_name
+        ]
+
+    def _start_events(self, overwrite):
+        """Prepares the other event endpoints to receive this pull's events."""
+        for endpoint in self.event_endpoints:
+            endpoint.sinks = endpoint._build_sinks()
+            if overwrite:
+                for sink in endpoint.sinks:
+                    sink.reset()
+            endpoint.batch_data = []
+            endpoint.batch_responses = []
+            endpoint._reset_seen_keys()
+            endpoint._start_upserts(overwrite)
+
+    def _process_batch_data(self):
+        """Routes the batch to the other event endpoints, then processes call_ended."""
+        for endpoint in self.event_endpoints:
+            endpoint.batch_data = self.batch_data
+            # Duplicates dropped by the other events count toward this pull.
+            endpoint.progress = self.progress
+            endpoint._process_batch_data()
+        super()._process_batch_data()
+
+    def reprocess_archive(self):
+        """Rebuilds the tables of the other events along with call_ended."""
+        if os.path.exists(self.filename):
+            self._start_events(overwrite=False)
+        super().reprocess_archive()
+        for endpoint in self.event_endpoints:
+            for sink in endpoint.sinks:
+                sink.close()
+
+    def _reset_sinks(self, ranges=None):
+        """Clears the same windows of the other events' tables."""
+        if not super()._reset_sinks(ranges):
+            return False
+        for endpoint in self.event_endpoints:
+            endpoint._reset_sinks(ranges)
+        return True
+
+    def _can_reset_ranges(self):
+        """Nothing is cleared unless the other events' tables can be cleared too."""
+        events = [endpoint._can_reset_ranges() for endpoint in self.event_endpoints]
+        return all([super()._can_reset_ranges()] + events)
+
+    def _request_range(self, date):
+        return self._parse_window(date)
+
+    def _start_pull(self, course_ids, dates, overwrite):
+        """
+        Meet data is added incrementally, because the data is very large. However,
+        the data Google provides is not always fully up-to-date, so each pull starts
+        MEET_LOOKBACK_HOURS before the last successful one and replaces the events
+        that are already stored. The time since then is split into windows that are
+        requested side by side, rather than following one long chain of pages.
+        """
+        self.pull_started = datetime.utcnow()
         self.last_date = None
+        self._start_upserts(overwrite)
+        start_time = None
+        if not overwrite:
+            start_time = self._get_start_time()
+            if start_time is not None:
+                self.last_date = start_time.strftime(TIME_FORMAT)
+        if dates == [None]:
+            window_start = start_time or self._default_start_time()
+            dates = self._time_windows(window_start, self.pull_started)
+        super()._start_pull(course_ids, dates, overwrite)
+        if start_time is not None:
+            logging.debug(
+                f"{self.classname()}: pulling data from {self.last_date}, replacing"
+                f" the events stored until {self.stored_until}."
+            )
+        self._start_events(overwrite)
+
+    def _default_start_time(self):
+        """The start of the school year, or as far back as Google keeps Meet data."""
+        if self.config.SCHOOL_YEAR_START:
+            return datetime.strptime(self.config.SCHOOL_YEAR_START, "%Y-%m-%d")
+        return self.pull_started - timedelta(days=180)
+
+    def _time_windows(self, start_time, end_time):
+        """Splits the time range into windows of MEET_WINDOW_HOURS, as strings."""
+        step = timedelta(hours=self.config.MEET_WINDOW_HOURS)
+        windows = []
+        window_start = start_time
+        while window_start < end_time:
+            window_end = min(window_start + step, end_time)
+            windows.append(self._format_window(window_start, window_end))
+            window_start = window_end
+        return windows
+
+    def _format_window(self, start_time, end_time):
+        return f"{start_time.strftime(TIME_FORMAT)}/{end_time.strftime(TIME_FORMAT)}"
+
+    def _parse_window(self, window):
+        start_time, end_time = window.split("/")
+        return (
+            datetime.strptime(start_time, TIME_FORMAT),
+            datetime.strptime(end_time, TIME_FORMAT),
+        )
+
+    def _history_key(self, course_id, date):
+        """Windows differ every run, so all of them share one page count."""
+        return "window"
+
+    def _handle_response(self, request_id, response, exception):
+        """
+        Splits dense windows instead of paging through them. Events come newest
+        first, so when the first page of a window has more, the rest of the window
+        is the time up to the page's oldest event. That time is requested as two new
+        windows, until windows reach MEET_MIN_WINDOW_MINUTES.
+        """
+        _, window, next_page_token, _, _ = self._get_request_info(request_id)
+        if (
+            not exception
+            and window
+            and next_page_token is None
+            and "nextPageToken" in response
+            and response.get(self.request_key)
+        ):
+            windows = self._split_window(window, response[self.request_key])
+            if windows:
+                response = {
+                    key: value
+                    for (key, value) in response.items()
+                    if key != "nextPageToken"
+                }
+                for new_window in windows:
+                    request_tuple = self._generate_request_tuple(
+                        None, new_window, None, 0
+                    )
+                    self.remaining_requests.append(request_tuple)
+                self.progress.record_queued(len(windows))
+        super()._handle_response(request_id, response, exception)
+
+    def _split_window(self, window, records):
+        """
+        Returns the halves of the window up to the oldest record, if any. The end time
+        is exclusive, so the window ends just after the oldest record: records at the
+        same time, like the call_ended events of everyone in a call the host ended,
+        may be on later pages. Those on the first page are dropped as duplicates.
+        """
+        start_time, _ = self._parse_window(window)
+        oldest = min([record["id"]["time"] for record in records])
+        oldest = pd.to_datetime(oldest).tz_localize(None).to_pydatetime()
+        minimum = timedelta(minutes=self.config.MEET_MIN_WINDOW_MINUTES)
+        if oldest - start_time < 2 * minimum:
+            return None
+        middle = start_time + (oldest - start_time) / 2
+        return [
+            self._format_window(start_time, middle),
+            self._format_window(middle, oldest + timedelta(milliseconds=1)),
+        ]
+
+    def _get_start_time(self):
+        """
+        Returns the lookback window before the last pull that finished, or before the
+        latest stored event if no pull has finished yet. None pulls everything, which
+        is also the case when the table is empty or was dropped since the last pull.
+        """
+        last_time = self.stored_until
+        if last_time is None:
+            return None
+        watermark = self.history.data.get("watermark")
+        if watermark:
+            last_time = datetime.strptime(watermark, TIME_FORMAT)
+        return last_time - timedelta(hours=self.config.MEET_LOOKBACK_HOURS)
+
+    def _latest_stored_time(self):
+        try:
+            table = self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return None
+        query = select([func.max(table.c.item_time)])
+        last_time = self.sql.engine.execute(query).scalar()
+        return pd.to_datetime(last_time) if last_time is not None else None
+
+    def _start_upserts(self, overwrite):
+        """Finds the latest stored event, unless the pull replaces the table."""
+        self.stored_until = None
+        if overwrite:
+            return
+        try:
+            table = self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return
+        self._upgrade_item_time(table)
+        self.stored_until = self._latest_stored_time()
+
+    def _insert(self, connection, df, chunksize=None):
+        """
+        Upserts the events on their natural key: the stored events the batch holds
+        again are deleted in the same transaction it is inserted in. Only events
+        up to the latest stored one can be stored already, unless the keys seen this
+        run outgrew DEDUPE_MAX_KEYS and duplicates within the run got through.
+        """
+        if self.seen_keys.full:
+            stored = df
+        elif self.stored_until is not None:
+            stored = df[df["item_time"] <= self.stored_until]
+        else:
+            stored = df.iloc[:0]
+        if len(stored) > 0:
+            self._delete_keys(connection, stored)
+        super()._insert(connection, df, chunksize)
+
+    def _delete_keys(self, connection, df):
+        """Deletes the stored events with the natural keys of the rows."""
+        try:
+            table = self.sql.table(self.load_table_name)
+        except NoSuchTableError:
+            return
+        # Each key takes a parameter per column.
+        size = CHUNK_SIZE // len(self.natural_key)
+        for keys in chunks(self._key_tuples(df), size):
+            matches = [
+                and_(
+                    *[
+                        table.c[column] == value
+                        for (column, value) in zip(self.natural_key, key)
+                    ]
+                )
+                for key in keys
+            ]
+            connection.execute(table.delete().where(or_(*matches)))
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
-        """Request Google Meet events (currently only call_ended)"""
+    def _upgrade_item_time(self, table):
+        """
+        Changes item_time to DATETIME2 in MSSQL tables created while it was DATETIME,
+        which rounds times to 1/300 of a second, so the times read back never match
+        those of events pulled again. Its indexes are dropped first and rebuilt.
+        """
+        if self.sql.engine.dialect.name != "mssql":
+            return
+        if isinstance(table.c.item_time.type, mssql.DATETIME2):
+            return
+        logging.info(f"{self.classname()}: changing item_time to DATETIME2.")
+        indexes = [
+            index
+            for index in table.indexes
+            if "item_time" in [column.name for column in index.columns]
+        ]
+        preparer = self.sql.engine.dialect.identifier_preparer
+        statement = (
+            f"ALTER TABLE {preparer.format_table(table)}"
+            " ALTER COLUMN item_time DATETIME2 NULL"
+        )
+        with self.sql.engine.begin() as connection:
+            for index in indexes:
+                connection.execute(DropIndex(index))
+            connection.execute(text(statement))
+        self._build_indexes()
+
+    def _finish_pull(self):
+        """Records when the pull started, so the next one can continue from there."""
+        if not self.dead_letters:
+            self.history.data["watermark"] = self.pull_started.strftime(TIME_FORMAT)
+        for endpoint in self.event_endpoints:
+            for sink in endpoint.sinks:
+                sink.close()
+        super()._finish_pull()
+
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
+        """
+        Request Google Meet events. Only call_ended is filtered for by the API, since
+        it takes a single event name; with other events, all of them are requested.
+        """
+        event_name = None if self.event_endpoints else self.event_name
         options = {
             "applicationName": "meet",
             "userKey": "all",
-            "eventName": "call_ended",
+            "eventName": event_name,
             "pageToken": next_page_token,
+            "maxResults": page_size,
+            "fields": self.response_fields(),
         }
-        # Meet data is added incrementally, because the data is very large. However,
-        # the data Google provides is not always fully up-to-date. As a result, the
-        # most reliable way to obtain incremental updated data is to drop the last
-        # 24 hours of data and then request data from Google starting at that point.
-        if next_page_token is None:
-            # Only set the last_date on the first request.
-            data = self.return_all_data()
-            if data is not None and data.item_time.count() > 0:
-                last_date = data.item_time.max()
-                table = self.sql.table(self.table_name)
-                last_date = last_date - timedelta(hours=24)
-                delete_query = table.delete().where(table.c.item_time > last_date)
-                self.sql.engine.execute(delete_query)
-                last_date = last_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-                logging.debug(f"{self.classname()}: pulling data from {last_date}.")
-                self.last_date = last_date
-            else:
-                self.last_date = None
-        if self.last_date:
+        if date:
+            start_time, end_time = date.split("/")
+            options["startTime"] = start_time
+            options["endTime"] = end_time
+        elif self.last_date:
             options["startTime"] = self.last_date
 
         return self.service.activities().list(**options)
 
     def preprocess_records(self, records):
-        """Pull out parameter data from the returned Google Meet call event"""
+        """Pull out parameter data from the returned Google Meet events"""
         new_records = []
         for record in records:
             event_records = record.get("events")
             item_time = record.get("id").get("time")
             for event_record in event_records:
                 event_name = event_record.get("name")
-                if event_name == "call_ended":
+                if event_name == self.event_name:
                     new_record = {"item_time": item_time, "event_name": event_name}
                     for subrecord in event_record.get("parameters"):
                         name = subrecord.get("name")
-                        value = (
-                            subrecord.get("value")
-                            or subrecord.get("intValue")
-                            or subrecord.get("boolValue")
+                        value = next(
+                            (subrecord[key] for key in VALUE_KEYS if key in subrecord),
+                            None,
                         )
                         new_record[name] = value
                     new_records.append(new_record)
         return new_records
+
+
+class MeetEvent(Meet):
+    """
+    Google Meet events other than call_ended, in a table per event name. Parameters
+    shared by most Meet events have their own columns, and the rest are kept as JSON
+    in `parameters`. Requests are made by the Meet endpoint, which passes each batch
+    on, so a MeetEvent isn't pulled by itself. Each event name has its own subclass,
+    made by `for_event`, since the class name names its table and files.
+    """
+
+    event_name = None
+
+    @classmethod
+    def for_event(cls, event_name):
+        """Returns the subclass for the event name, such as "presentation_started"."""
+        return type(f"Meet_{event_name}", (cls,), {"event_name": event_name})
+
+    def __init__(self, service, sql, config):
+        super().__init__(service, sql, config)
+        self.columns = [
+            "conference_id",
+            "device_type",
+            "display_name",
+            "endpoint_id",
+            "identifier",
+            "identifier_type",
+            "is_external",
+            "meeting_code",
+            "organizer_email",
+            "item_time",
+            "event_name",
+            "parameters",
+        ]
+
+    @classmethod
+    def classname(cls):
+        return f"Meet_{cls.event_name}"
+
+    def _build_event_endpoints(self):
+        return []
+
+    def preprocess_records(self, records):
+        """Moves parameters without their own column into JSON."""
+        new_records = []
+        for record in super().preprocess_records(records):
+            parameters = {
+                name: record.pop(name)
+                for name in list(record.keys())
+                if name not in self.columns
+            }
+            record["parameters"] = json.dumps(parameters) if parameters else None
+            new_records.append(record)
+        return new_records
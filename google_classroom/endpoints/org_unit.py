@@ -1,3 +1,4 @@
+from column_types import ID, NAME, String
 from endpoints.base import EndPoint
 
 
@@ -5,12 +6,25 @@ class OrgUnits(EndPoint):
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.columns = ["name", "description", "orgUnitPath", "orgUnitId"]
+        self.column_types = {
+            "name": NAME,
+            "description": String(),
+            "orgUnitPath": String(),
+            "orgUnitId": ID,
+        }
         self.request_key = "organizationUnits"
+        # Org units are returned in a single response without pagination.
+        self.page_fields = []
         self.batch_size = config.ORG_UNIT_BATCH_SIZE
+        self.natural_key = ["orgUnitId"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         """Request org unit that matches the given path"""
-        return self.service.orgunits().list(customerId="my_customer")
+        return self.service.orgunits().list(
+            customerId="my_customer", fields=self.response_fields()
+        )
 
     def filter_data(self, dataframe):
         return dataframe.loc[dataframe.name == self.config.STUDENT_ORG_UNIT]
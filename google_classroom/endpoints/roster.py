@@ -0,0 +1,101 @@
+import sys
+
+from column_types import EMAIL, ID, NAME
+from endpoints.base import EndPoint
+from endpoints.user import Users
+
+
+class Roster(EndPoint):
+    """
+    The users enrolled in each course, with their profiles. When NORMALIZE_ROSTERS is
+    set, only courseId and userId are kept, and each user's profile is written once
+    per pull to the Users table instead of on every enrollment.
+    """
+
+    def __init__(self, service, sql, config):
+        super().__init__(service, sql, config)
+        self.columns = ["courseId", "userId", "fullName", "emailAddress"]
+        self.column_types = {
+            "courseId": ID,
+            "userId": ID,
+            "fullName": NAME,
+            "emailAddress": EMAIL,
+        }
+        self.source_fields = {
+            "fullName": ["profile/name/fullName"],
+            "emailAddress": ["profile/emailAddress"],
+        }
+        self.indexes = [["courseId"], ["userId"]]
+        self.natural_key = ["courseId", "userId"]
+        self.users = None
+        if config.NORMALIZE_ROSTERS:
+            self.users = Users(service, sql, config)
+            self.columns = ["courseId", "userId"]
+            # The profiles are still requested, for the Users table.
+            self.source_fields = {
+                "userId": ["userId", "profile/name/fullName", "profile/emailAddress"]
+            }
+        # The IDs of the users whose profile was seen this pull.
+        self.user_ids = set()
+        self.new_profiles = []
+
+    def _start_pull(self, course_ids, dates, overwrite):
+        super()._start_pull(course_ids, dates, overwrite)
+        self._start_users()
+
+    def _start_users(self):
+        self.user_ids = set()
+        self.new_profiles = []
+        if self.users:
+            self.users._start_roster()
+
+    def preprocess_records(self, records):
+        """
+        Pulls out each record's profile. Profile strings are interned, so users
+        enrolled in many courses share one copy of them.
+        """
+        for record in records:
+            profile = record.pop("profile", None) or {}
+            full_name = profile.get("name", {}).get("fullName")
+            email_address = profile.get("emailAddress")
+            full_name = sys.intern(full_name) if full_name else full_name
+            email_address = (
+                sys.intern(email_address) if email_address else email_address
+            )
+            if not self.users:
+                record["fullName"] = full_name
+                record["emailAddress"] = email_address
+            elif record.get("userId") not in self.user_ids:
+                self.user_ids.add(record.get("userId"))
+                self.new_profiles.append(
+                    {
+                        "userId": record.get("userId"),
+                        "fullName": full_name,
+                        "emailAddress": email_address,
+                    }
+                )
+        return records
+
+    def _process_batch_data(self):
+        """Processes the enrollments, then writes the profiles of new users."""
+        super()._process_batch_data()
+        if self.users and self.new_profiles:
+            self.users.batch_data = self.new_profiles
+            self.users.progress = self.progress
+            self.users._process_batch_data()
+            self.new_profiles = []
+
+    def reprocess_archive(self):
+        """Rebuilds the profiles of the users along with the enrollments."""
+        self._start_users()
+        super().reprocess_archive()
+        self._close_users()
+
+    def _finish_pull(self):
+        self._close_users()
+        super()._finish_pull()
+
+    def _close_users(self):
+        if self.users:
+            for sink in self.users.sinks:
+                sink.close()
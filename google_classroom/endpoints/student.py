@@ -1,26 +1,22 @@
-from endpoints.base import EndPoint
+from endpoints.roster import Roster
 
 
-class Students(EndPoint):
+class Students(Roster):
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
-        self.columns = ["courseId", "userId", "fullName", "emailAddress"]
         self.request_key = "students"
         self.batch_size = config.STUDENTS_BATCH_SIZE
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.courses()
             .students()
             .list(
                 pageToken=next_page_token,
                 courseId=course_id,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
-
-    def preprocess_records(self, records):
-        for record in records:
-            record["fullName"] = record.get("profile").get("name").get("fullName")
-            record["emailAddress"] = record.get("profile").get("emailAddress")
-        return records
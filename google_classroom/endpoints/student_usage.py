@@ -2,7 +2,9 @@ import logging
 import pandas as pd
 from datetime import datetime
 
+from column_types import EMAIL
 from endpoints.base import EndPoint
+from rollups import daily_active_users, Rollup
 
 
 class StudentUsage(EndPoint):
@@ -10,9 +12,30 @@ class StudentUsage(EndPoint):
         super().__init__(service, sql, config)
         self.date_columns = ["AsOfDate", "LastUsedTime", "ImportDate"]
         self.columns = ["Email", "AsOfDate", "LastUsedTime", "ImportDate"]
+        self.column_types = {"Email": EMAIL}
+        self.source_fields = {
+            "Email": ["entity/userEmail"],
+            "AsOfDate": ["date"],
+            "LastUsedTime": ["parameters/name", "parameters/datetimeValue"],
+            "ImportDate": [],
+        }
+        self.page_fields = ["nextPageToken", "warnings"]
         self.org_unit_id = org_unit_id
         self.request_key = "usageReports"
         self.batch_size = config.USAGE_BATCH_SIZE
+        self.indexes = [["AsOfDate"], ["Email"]]
+        self.natural_key = ["Email", "AsOfDate"]
+        self.incremental_column = "AsOfDate"
+        if config.BUILD_ROLLUPS:
+            self.rollups = [
+                Rollup(
+                    self,
+                    "Daily",
+                    ["AsOfDate"],
+                    ["Email", "AsOfDate", "LastUsedTime"],
+                    daily_active_users,
+                )
+            ]
 
     def get_last_date(self):
         """Gets the last available date of data in the database."""
@@ -25,12 +48,16 @@ class StudentUsage(EndPoint):
             # Table doesn't yet exist.
             return None
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         options = {
             "userKey": "all",
             "date": date,
             "pageToken": next_page_token,
+            "maxResults": page_size,
             "parameters": "classroom:last_interaction_time",
+            "fields": self.response_fields(),
         }
         if self.org_unit_id:
             options["orgUnitID"] = self.org_unit_id
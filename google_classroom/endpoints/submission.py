@@ -1,7 +1,23 @@
+import logging
+
+from column_types import Boolean, Category, Float, ID
 from endpoints.base import EndPoint
+from rollups import Rollup, submission_counts
+
+# The date of requests for the IDs of a course's course work, to fan it out.
+LIST_COURSEWORK = "courseWork"
 
 
 class StudentSubmissions(EndPoint):
+    """
+    Student submissions, requested per course across all its course work. Large
+    courses are fanned out into a request per course work instead, so their pages
+    are requested side by side rather than one after another. Their course work is
+    listed in the same pull, so course work created since CourseWork was last pulled
+    is included. The course work requested is carried in the date slot of request
+    IDs.
+    """
+
     def __init__(self, service, sql, config):
         super().__init__(service, sql, config)
         self.date_columns = [
@@ -35,10 +51,75 @@ class StudentSubmissions(EndPoint):
             "assignedGraderId",
             "late",
         ]
+        state_fields = [
+            "submissionHistory/stateHistory/state",
+            "submissionHistory/stateHistory/stateTimestamp",
+        ]
+        grade_fields = [
+            "submissionHistory/gradeHistory/gradeChangeType",
+            "submissionHistory/gradeHistory/maxPoints",
+            "submissionHistory/gradeHistory/gradeTimestamp",
+            "submissionHistory/gradeHistory/actorUserId",
+        ]
+        self.column_types = {
+            "courseId": ID,
+            "courseWorkId": ID,
+            "id": ID,
+            "userId": ID,
+            "state": Category(),
+            "draftGrade": Float(),
+            "assignedGrade": Float(),
+            "courseWorkType": Category(),
+            "draftMaxPoints": Float(),
+            "draftGraderId": ID,
+            "assignedMaxPoints": Float(),
+            "assignedGraderId": ID,
+            "late": Boolean(),
+        }
+        self.source_fields = {
+            "createdTime": state_fields,
+            "turnedInTimestamp": state_fields,
+            "returnedTimestamp": state_fields,
+            "draftMaxPoints": grade_fields,
+            "draftGradeTimestamp": grade_fields,
+            "draftGraderId": grade_fields,
+            "assignedMaxPoints": grade_fields,
+            "assignedGradeTimestamp": grade_fields,
+            "assignedGraderId": grade_fields,
+        }
         self.request_key = "studentSubmissions"
         self.batch_size = config.SUBMISSIONS_BATCH_SIZE
+        self.indexes = [["courseId"], ["courseWorkId"], ["userId"]]
+        self.natural_key = ["id"]
+        if config.BUILD_ROLLUPS:
+            counted = ["courseId", "courseWorkId", "userId", "id", "state", "late"]
+            self.rollups = [
+                Rollup(self, name, group_by, counted, submission_counts)
+                for (name, group_by) in [
+                    ("ByCourse", ["courseId"]),
+                    ("ByStudent", ["courseId", "userId"]),
+                    ("ByCourseWork", ["courseId", "courseWorkId"]),
+                ]
+            ]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
+        """
+        Requests a course's submissions, for one course work if date is set, or the
+        IDs of its course work if date is LIST_COURSEWORK.
+        """
+        if date == LIST_COURSEWORK:
+            return (
+                self.service.courses()
+                .courseWork()
+                .list(
+                    courseId=course_id,
+                    pageToken=next_page_token,
+                    pageSize=page_size,
+                    fields="nextPageToken,courseWork/id",
+                )
+            )
         return (
             self.service.courses()
             .courseWork()
@@ -46,10 +127,91 @@ class StudentSubmissions(EndPoint):
             .list(
                 pageToken=next_page_token,
                 courseId=course_id,
-                courseWorkId="-",
-                pageSize=self.config.PAGE_SIZE,
+                courseWorkId=date or "-",
+                states=self.config.SUBMISSION_STATES,
+                late=self.config.SUBMISSION_LATE,
+                pageSize=page_size,
+                fields=self.response_fields(),
+            )
+        )
+
+    def _history_key(self, course_id, date):
+        """Fanned out requests count toward their course."""
+        return super()._history_key(course_id, None)
+
+    def _start_pull(self, course_ids, dates, overwrite):
+        """Fans out the courses that had more than SUBMISSION_FANOUT_PAGES last run."""
+        self.run_course_records = {}
+        super()._start_pull(course_ids, dates, overwrite)
+        if not self.config.SUBMISSION_FANOUT_PAGES:
+            return
+        remaining_requests = []
+        for request_tuple in self.remaining_requests:
+            course_id, _, _, _, _ = self._get_request_info(request_tuple[1])
+            if self._is_large(course_id):
+                request_tuple = self._list_coursework(course_id)
+            remaining_requests.append(request_tuple)
+        self.remaining_requests = remaining_requests
+
+    def _course_records(self):
+        return self.history.data.setdefault("course_records", {})
+
+    def _is_large(self, course_id):
+        records = self._course_records().get(course_id, 0)
+        return records / self.page_size >= self.config.SUBMISSION_FANOUT_PAGES
+
+    def _list_coursework(self, course_id):
+        """Returns a request for the IDs of the course's course work."""
+        logging.debug(f"{self.classname()}: fanning out course {course_id}.")
+        return self._generate_request_tuple(course_id, LIST_COURSEWORK, None, 0)
+
+    def _fan_out(self, request_id, response):
+        """Queues a request for each course work listed, and the next page of them."""
+        course_id, _, _, page, page_size = self._get_request_info(request_id)
+        coursework_ids = [item["id"] for item in response.get("courseWork", [])]
+        requests = [
+            self._generate_request_tuple(course_id, coursework_id, None, 0)
+            for coursework_id in coursework_ids
+        ]
+        if "nextPageToken" in response:
+            requests.append(
+                self._generate_request_tuple(
+                    course_id,
+                    LIST_COURSEWORK,
+                    response["nextPageToken"],
+                    int(page) + 1,
+                    page_size,
+                )
             )
+        logging.debug(
+            f"{self.classname()}: fanning course {course_id} out into"
+            f" {len(coursework_ids)} requests."
         )
+        self.remaining_requests.extend(requests)
+        self.progress.record_response(0, "nextPageToken" in response)
+        self.progress.record_queued(len(coursework_ids))
+
+    def _handle_response(self, request_id, response, exception):
+        """
+        Fans out courses by the course work listed for them, and counts each course's
+        submissions for the next run. Courses without history are paged through, and
+        fanned out from the next run on if they turn out to be large.
+        """
+        course_id, coursework_id, _, _, _ = self._get_request_info(request_id)
+        if coursework_id == LIST_COURSEWORK and not exception:
+            self._fan_out(request_id, response)
+            return
+        if not exception:
+            records = len(response.get(self.request_key, []))
+            self.run_course_records[course_id] = (
+                self.run_course_records.get(course_id, 0) + records
+            )
+        super()._handle_response(request_id, response, exception)
+
+    def _finish_pull(self):
+        """Keeps the submission counts of the courses pulled this run."""
+        self.history.data["course_records"] = self.run_course_records
+        super()._finish_pull()
 
     def _parse_state_history(self, record, parsed):
         """Flatten timestamp records from nested state history"""
@@ -1,3 +1,4 @@
+from column_types import ID, NAME
 from endpoints.base import EndPoint
 
 
@@ -6,16 +7,22 @@ class Topics(EndPoint):
         super().__init__(service, sql, config)
         self.date_columns = ["updateTime"]
         self.columns = ["courseId", "topicId", "name", "updateTime"]
+        self.column_types = {"courseId": ID, "topicId": ID, "name": NAME}
         self.request_key = "topic"
         self.batch_size = config.TOPICS_BATCH_SIZE
+        self.indexes = [["courseId"]]
+        self.natural_key = ["courseId", "topicId"]
 
-    def request_data(self, course_id=None, date=None, next_page_token=None):
+    def request_data(
+        self, course_id=None, date=None, next_page_token=None, page_size=None
+    ):
         return (
             self.service.courses()
             .topics()
             .list(
                 pageToken=next_page_token,
                 courseId=course_id,
-                pageSize=self.config.PAGE_SIZE,
+                pageSize=page_size,
+                fields=self.response_fields(),
             )
         )
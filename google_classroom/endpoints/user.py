@@ -0,0 +1,40 @@
+from column_types import EMAIL, ID, NAME
+from endpoints.base import EndPoint
+from sql_chunks import execute_in_chunks
+from sqlalchemy.exc import NoSuchTableError
+
+
+class Users(EndPoint):
+    """
+    The profiles of the users in course rosters, one row per user, when
+    NORMALIZE_ROSTERS is set. Profiles are passed on by the Students and Teachers
+    endpoints, so Users isn't pulled by itself. Rows are upserted, so the table keeps
+    users from earlier pulls and each user's latest profile.
+    """
+
+    def __init__(self, service, sql, config):
+        super().__init__(service, sql, config)
+        self.columns = ["userId", "fullName", "emailAddress"]
+        self.column_types = {"userId": ID, "fullName": NAME, "emailAddress": EMAIL}
+        self.indexes = [["emailAddress"]]
+        self.natural_key = ["userId"]
+
+    def _start_roster(self):
+        """Prepares to receive the profiles of a roster pull."""
+        self.sinks = self._build_sinks()
+        self.batch_data = []
+        self.batch_responses = []
+        self._reset_seen_keys()
+
+    def _insert_in_transaction(self, df, chunksize=None):
+        """Replaces the stored rows of the users in the dataframe, then inserts them."""
+        with self.sql.engine.begin() as connection:
+            self._delete_users(connection, list(df["userId"]))
+            self._insert(connection, df, chunksize)
+
+    def _delete_users(self, connection, user_ids):
+        try:
+            table = self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return
+        execute_in_chunks(connection, table.delete(), table.c.userId, user_ids)
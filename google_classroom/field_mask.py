@@ -0,0 +1,94 @@
+import json
+import re
+
+
+def _add_path(tree, parts):
+    """Adds a split path to the tree. A None leaf selects the whole field."""
+    name, rest = parts[0], parts[1:]
+    if not rest:
+        tree[name] = None
+    elif tree.get(name, {}) is not None:
+        _add_path(tree.setdefault(name, {}), rest)
+
+
+def _render(tree):
+    """Renders a field tree into the partial response syntax."""
+    fields = []
+    for name, children in tree.items():
+        fields.append(f"{name}({_render(children)})" if children else name)
+    return ",".join(fields)
+
+
+def build_field_mask(paths):
+    """
+    Builds a `fields` partial response mask from a list of slash separated paths,
+    grouping shared prefixes. For example, ["a/b", "a/c", "d"] becomes "a(b,c),d".
+    """
+    tree = {}
+    for path in paths:
+        _add_path(tree, path.split("/"))
+    return _render(tree)
+
+
+def _parse_fields(tokens):
+    """Parses a comma separated list of fields from the token list into a tree."""
+    tree = {}
+    while tokens:
+        name = tokens.pop(0)
+        tree[name] = _parse_children(tokens)
+        if not tokens or tokens[0] == ")":
+            break
+        tokens.pop(0)  # Consume the comma.
+    return tree
+
+
+def _parse_children(tokens):
+    """Parses the sub-selection following a field name, if there is one."""
+    if tokens and tokens[0] == "/":
+        tokens.pop(0)
+        name = tokens.pop(0)
+        return {name: _parse_children(tokens)}
+    if tokens and tokens[0] == "(":
+        tokens.pop(0)
+        children = _parse_fields(tokens)
+        tokens.pop(0)  # Consume the closing parenthesis.
+        return children
+    return None
+
+
+def parse_field_mask(fields):
+    """Parses a `fields` partial response mask into a nested dictionary tree."""
+    tokens = re.findall(r"[^,()/]+|[,()/]", fields.replace(" ", ""))
+    return _parse_fields(tokens)
+
+
+def apply_field_mask(data, fields):
+    """
+    Applies a `fields` mask to a recorded API response the same way the API does,
+    returning only the selected fields.
+    """
+    return _apply_tree(data, parse_field_mask(fields))
+
+
+def _apply_tree(data, tree):
+    if tree is None:
+        return data
+    if isinstance(data, list):
+        return [_apply_tree(item, tree) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        key: _apply_tree(value, tree[key]) for key, value in data.items() if key in tree
+    }
+
+
+def mask_savings(response, fields):
+    """
+    Measures the effect of a field mask on a recorded API response.
+
+    Returns:
+        A tuple of (full response bytes, masked response bytes).
+    """
+    full_bytes = len(json.dumps(response))
+    masked_bytes = len(json.dumps(apply_field_mask(response, fields)))
+    return (full_bytes, masked_bytes)
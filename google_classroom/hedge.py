@@ -0,0 +1,120 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import copy
+import logging
+import socket
+import time
+
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import build_http
+
+# Requests still running past this percentile of recent latencies are stragglers.
+PERCENTILE = 95
+# Latencies needed before the percentile is trusted over HEDGE_MIN_SECONDS.
+MIN_SAMPLES = 20
+
+
+def thread_http(request):
+    """
+    Returns a new authorized connection for executing the request from a thread, since
+    httplib2 connections can't be shared. None executes it on its own connection.
+    """
+    credentials = getattr(getattr(request, "http", None), "credentials", None)
+    if credentials is None:
+        return None
+    return AuthorizedHttp(credentials, http=build_http())
+
+
+def duplicate(request):
+    """
+    Returns a copy of the request that can be executed alongside it. Requests are
+    shallow copied, except for the headers that executing one changes.
+    """
+    hedge = copy.copy(request)
+    if isinstance(getattr(request, "headers", None), dict):
+        hedge.headers = dict(request.headers)
+    return hedge
+
+
+class Hedger:
+    """
+    Executes requests on their own rather than in a batch, for the last few requests
+    of a pull, whose latency decides when it finishes. A request still running past
+    the 95th percentile of recent latencies is a straggler, and a duplicate of it is
+    sent. The first response wins. Neither is waited on past REQUEST_TIMEOUT.
+
+    Parameters:
+        name:       The name of the endpoint, for logging.
+        config:     A config object with the hedging settings.
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.min_seconds = config.HEDGE_MIN_SECONDS
+        self.timeout = config.REQUEST_TIMEOUT
+        self.latencies = deque(maxlen=200)
+        self.start()
+
+    def start(self):
+        """Resets the counts of a pull, and allows hedging again."""
+        self.enabled = True
+        self.stragglers = 0
+        self.hedge_wins = 0
+
+    def disable(self):
+        """Stops hedging for the rest of the pull, like when quota is exceeded."""
+        self.enabled = False
+
+    def hedge_delay(self):
+        """Returns the seconds a request may run before it is a straggler."""
+        if len(self.latencies) < MIN_SAMPLES:
+            return self.min_seconds
+        latencies = sorted(self.latencies)
+        index = int(len(latencies) * PERCENTILE / 100)
+        return max(self.min_seconds, latencies[min(index, len(latencies) - 1)])
+
+    def _execute(self, request):
+        http = thread_http(request)
+        return request.execute(http=http) if http else request.execute()
+
+    def execute(self, request):
+        """
+        Returns the first successful response of the request or its hedge. Raises the
+        first error if both fail, or socket.timeout if neither responds in time.
+        """
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(self._execute, request)
+            pending = {primary}
+            delay = self.hedge_delay()
+            if self.enabled and not wait(pending, timeout=delay).done:
+                self.stragglers += 1
+                logging.debug(
+                    f"{self.name}: request running past {round(delay, 2)}s,"
+                    " sending a hedged duplicate."
+                )
+                pending.add(executor.submit(self._execute, duplicate(request)))
+            error = None
+            while pending:
+                remaining = max(0, self.timeout - (time.time() - start))
+                done, pending = wait(pending, remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise socket.timeout(f"No response in {self.timeout} seconds.")
+                for future in done:
+                    if future.exception() is None:
+                        self.latencies.append(time.time() - start)
+                        if future is not primary:
+                            self.hedge_wins += 1
+                        return future.result()
+                    error = error or future.exception()
+            raise error
+        finally:
+            # A request that lost or timed out is left to finish in the background.
+            executor.shutdown(wait=False)
+
+    def summary(self):
+        return (
+            f"{self.name}: {self.stragglers} straggling requests hedged,"
+            f" {self.hedge_wins} answered first by the hedge."
+        )
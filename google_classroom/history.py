@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+
+
+class PullHistory:
+    """
+    Page counts and latencies recorded by previous runs of an endpoint, persisted to
+    /data so the next run can schedule its heaviest requests first. Both are kept
+    per request key, like a course, and latency also as a moving average for the
+    endpoint.
+
+    Parameters:
+        name:   The name of the endpoint the history belongs to.
+    """
+
+    def __init__(self, name):
+        self.filename = f"data/{name.lower()}_history.json"
+        self.data = {"pages": {}, "seconds": {}, "seconds_per_request": None}
+        self.run_pages = {}
+        self.run_seconds = {}
+        self.load()
+
+    def load(self):
+        """Loads the history saved by the last run, if there is one."""
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename) as file:
+                    self.data.update(json.load(file))
+            except ValueError as error:
+                logging.debug(f"{self.filename}: unable to read history, {error}")
+
+    def save(self):
+        """
+        Saves the page counts and latencies seen in this run in place of the previous
+        ones, so keys that aren't requested anymore, like past dates or archived
+        courses, are let go.
+        """
+        self.data["pages"] = self.run_pages
+        self.data["seconds"] = self.run_seconds
+        self.run_pages = {}
+        self.run_seconds = {}
+        with open(self.filename, "w") as file:
+            json.dump(self.data, file)
+
+    def expected_pages(self, key):
+        """Returns the number of pages the request took last run, defaulting to 1."""
+        return self.data["pages"].get(key, 1)
+
+    def record_page(self, key, page):
+        """Records that a page was received for the request with the given key."""
+        self.run_pages[key] = max(self.run_pages.get(key, 0), int(page) + 1)
+
+    def record_seconds(self, key, seconds):
+        """Adds to the time spent on the requests with the given key."""
+        self.run_seconds[key] = self.run_seconds.get(key, 0) + seconds
+
+    def record_batch(self, seconds, requests):
+        """Records the latency of a batch as a moving average per request."""
+        if requests == 0:
+            return
+        latency = seconds / requests
+        previous = self.data["seconds_per_request"]
+        if previous is None:
+            self.data["seconds_per_request"] = latency
+        else:
+            self.data["seconds_per_request"] = 0.8 * previous + 0.2 * latency
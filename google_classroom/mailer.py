@@ -23,9 +23,12 @@ class Mailer:
 
     def _body_text(self):
         if self.error_message:
-            return f"{self.jobname} encountered an error.\n{self.error_message}"
+            text = f"{self.jobname} encountered an error.\n{self.error_message}"
         else:
-            return f"{self.jobname} completed successfully."
+            text = f"{self.jobname} completed successfully."
+        if self.profiles:
+            text += "\n\n" + "\n\n".join(self.profiles)
+        return text
 
     def _attachments(self, msg):
         filename = "data/app.log"
@@ -44,8 +47,10 @@ class Mailer:
         self._attachments(msg)
         return msg.as_string()
 
-    def notify(self, error_message=None):
+    def notify(self, error_message=None, profiles=None):
+        """Emails the outcome of the job, with the summaries of its profiled pulls."""
         self.error_message = error_message
+        self.profiles = profiles or []
         with self.server as s:
             s.login(self.user, self.password)
             msg = self._message()
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from functools import partial
 import logging
 import sys
 import traceback
@@ -8,6 +9,7 @@ from google.oauth2 import service_account
 import pandas as pd
 
 from endpoints import (
+    batch_pull_combined,
     Announcements,
     Courses,
     CourseAliases,
@@ -23,8 +25,12 @@ from endpoints import (
     Teachers,
     Topics,
 )
+from cassettes import Cassette, RecordingService, ReplayService
 from config import Config, db_generator
 from mailer import Mailer
+from profiler import Profile, PROFILES
+from progress import start_status_server
+from scheduler import Scheduler
 
 
 def configure_logging(config):
@@ -62,30 +68,98 @@ def get_credentials(config):
     )
 
 
+def build_services(creds, config):
+    """
+    Builds the Google API services once so they can be reused across pulls. If
+    RECORD_CASSETTE is set, their batch responses are also recorded to it.
+    """
+    services = {
+        "classroom": build("classroom", "v1", credentials=creds),
+        "admin_reports": build("admin", "reports_v1", credentials=creds),
+        "admin_directory": build("admin", "directory_v1", credentials=creds),
+    }
+    if config.RECORD_CASSETTE:
+        cassette = Cassette(config.RECORD_CASSETTE, config.CASSETTE_SALT)
+        cassette.reset()
+        logging.info(f"Recording responses to {config.RECORD_CASSETTE}.")
+        services = {
+            name: RecordingService(service, cassette)
+            for (name, service) in services.items()
+        }
+    return services
+
+
+def replay_services(config):
+    """Builds services that answer from the REPLAY_CASSETTE instead of the API."""
+    logging.info(f"Replaying responses from {config.REPLAY_CASSETTE}.")
+    service = ReplayService(
+        Cassette(config.REPLAY_CASSETTE), latency=config.REPLAY_LATENCY
+    )
+    return {name: service for name in ["classroom", "admin_reports", "admin_directory"]}
+
+
 def main(config):
     configure_logging(config)
-    creds = get_credentials(config)
+    if config.STATUS_PORT:
+        start_status_server(config.STATUS_HOST, config.STATUS_PORT)
     sql = db_generator(config)
-    pull_data(config, creds, sql)
+    if config.REPROCESS:
+        reprocess_data(config, sql)
+        logging.info(sql.pool_stats.summary())
+        return
+    if config.REPLAY_CASSETTE:
+        services = replay_services(config)
+    else:
+        services = build_services(get_credentials(config), config)
+    if config.DAEMON:
+        run_daemon(config, services, sql)
+        return
+    pull_data(config, services, sql)
     if config.SYNC:
-        sync_all_data(config, creds, sql)
+        sync_all_data(config, services, sql)
+    logging.info(sql.pool_stats.summary())
 
 
-def pull_data(config, creds, sql):
-    classroom_service = build("classroom", "v1", credentials=creds)
-    admin_reports_service = build("admin", "reports_v1", credentials=creds)
-    admin_directory_service = build("admin", "directory_v1", credentials=creds)
+def roster_endpoints(config):
+    """Per-course endpoints holding enrollments, as (enabled, endpoint) pairs."""
+    return [
+        (config.PULL_INVITATIONS, Invitations),
+        (config.PULL_ALIASES, CourseAliases),
+        (config.PULL_STUDENTS, Students),
+        (config.PULL_TEACHERS, Teachers),
+    ]
+
+
+def coursework_endpoints(config):
+    """Per-course endpoints holding course content, as (enabled, endpoint) pairs."""
+    return [
+        (config.PULL_ANNOUNCEMENTS, Announcements),
+        (config.PULL_TOPICS, Topics),
+        (config.PULL_COURSEWORK, CourseWork),
+    ]
+
 
-    # Get usage
+def pull_data(config, services, sql):
+    pull_usage(config, services, sql)
+    pull_guardians(config, services, sql)
+    pull_courses(config, services, sql)
+    pull_course_endpoints(
+        config, services, sql, roster_endpoints(config) + coursework_endpoints(config)
+    )
+    pull_submissions(config, services, sql)
+    pull_meet(config, services, sql)
+
+
+def pull_usage(config, services, sql):
     if config.PULL_USAGE:
         # First get student org unit
-        orgUnits = OrgUnits(admin_directory_service, sql, config)
+        orgUnits = OrgUnits(services["admin_directory"], sql, config)
         orgUnits.batch_pull_data()
         result = orgUnits.return_all_data()
         org_unit_id = None if result.empty else result.iloc[0].loc["orgUnitId"]
 
         # Then get usage, loading data from after the last available day.
-        usage = StudentUsage(admin_reports_service, sql, config, org_unit_id)
+        usage = StudentUsage(services["admin_reports"], sql, config, org_unit_id)
         last_date = usage.get_last_date()
         if last_date:
             start_date = last_date + timedelta(days=1)
@@ -95,74 +169,143 @@ def pull_data(config, creds, sql):
         date_range_string = date_range.strftime("%Y-%m-%d")
         usage.batch_pull_data(dates=date_range_string, overwrite=False)
 
+
+def pull_guardians(config, services, sql):
     # Get guardians
     if config.PULL_GUARDIANS:
-        Guardians(classroom_service, sql, config).batch_pull_data()
+        Guardians(services["classroom"], sql, config).batch_pull_data()
 
     # Get guardian invites
     if config.PULL_GUARDIAN_INVITES:
-        GuardianInvites(classroom_service, sql, config).batch_pull_data()
+        GuardianInvites(services["classroom"], sql, config).batch_pull_data()
+
 
-    # Get courses
+def pull_courses(config, services, sql):
     if config.PULL_COURSES:
-        Courses(classroom_service, sql, config).batch_pull_data()
-
-    # Get list of course ids
-    if (
-        config.PULL_TOPICS
-        or config.PULL_COURSEWORK
-        or config.PULL_STUDENTS
-        or config.PULL_TEACHERS
-        or config.PULL_SUBMISSIONS
-        or config.PULL_ALIASES
-        or config.PULL_INVITATIONS
-        or config.PULL_ANNOUNCEMENTS
-        or config.PULL_MEET
-    ):
-        courses = Courses(classroom_service, sql, config).return_all_data()
-        courses = courses[courses["courseState"] == "ACTIVE"]
-        course_ids = courses.id.unique()
-
-    # Get course invitations
-    if config.PULL_INVITATIONS:
-        Invitations(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get course announcements
-    if config.PULL_ANNOUNCEMENTS:
-        Announcements(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get course aliases
-    if config.PULL_ALIASES:
-        CourseAliases(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get course topics
-    if config.PULL_TOPICS:
-        Topics(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get CourseWork
-    if config.PULL_COURSEWORK:
-        CourseWork(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get students and insert into database
-    if config.PULL_STUDENTS:
-        Students(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get teachers and insert into database
-    if config.PULL_TEACHERS:
-        Teachers(classroom_service, sql, config).batch_pull_data(course_ids)
-
-    # Get student coursework submissions
+        Courses(services["classroom"], sql, config).batch_pull_data()
+
+
+def get_course_ids(config, services, sql):
+    """Returns the IDs of the active courses in the database."""
+    courses = Courses(services["classroom"], sql, config).return_all_data()
+    courses = courses[courses["courseState"] == "ACTIVE"]
+    return courses.id.unique()
+
+
+def pull_course_endpoints(config, services, sql, endpoints):
+    """
+    Pulls the enabled per-course endpoints from a list of (enabled, endpoint) pairs,
+    together in shared batches if COMBINED_PULL is set.
+    """
+    course_endpoints = [
+        endpoint(services["classroom"], sql, config)
+        for (enabled, endpoint) in endpoints
+        if enabled
+    ]
+    if not course_endpoints:
+        return
+    course_ids = get_course_ids(config, services, sql)
+    if config.COMBINED_PULL:
+        with Profile("CombinedPull", config):
+            batch_pull_combined(course_endpoints, course_ids)
+    else:
+        for endpoint in course_endpoints:
+            endpoint.batch_pull_data(course_ids)
+
+
+def pull_submissions(config, services, sql):
     if config.PULL_SUBMISSIONS:
-        StudentSubmissions(classroom_service, sql, config).batch_pull_data(course_ids)
+        course_ids = get_course_ids(config, services, sql)
+        submissions = StudentSubmissions(services["classroom"], sql, config)
+        submissions.batch_pull_data(course_ids)
 
-    # Get Meet data
+
+def pull_meet(config, services, sql):
     if config.PULL_MEET:
-        Meet(admin_reports_service, sql, config).batch_pull_data(overwrite=False)
+        Meet(services["admin_reports"], sql, config).batch_pull_data(overwrite=False)
+
+
+def reprocess_data(config, sql):
+    """Rebuilds the enabled endpoints' output from their raw response archives."""
+    endpoints = [
+        (config.PULL_USAGE, OrgUnits),
+        (config.PULL_USAGE, partial(StudentUsage, org_unit_id=None)),
+        (config.PULL_GUARDIANS, Guardians),
+        (config.PULL_GUARDIAN_INVITES, GuardianInvites),
+        (config.PULL_COURSES, Courses),
+    ]
+    endpoints += roster_endpoints(config) + coursework_endpoints(config)
+    endpoints += [(config.PULL_SUBMISSIONS, StudentSubmissions)]
+    endpoints += [(config.PULL_MEET, Meet)]
+    for (enabled, endpoint) in endpoints:
+        if enabled:
+            # No service is needed, since nothing is requested from the API.
+            endpoint(None, sql, config).reprocess_archive()
+
+
+def pull_rosters(config, services, sql):
+    pull_guardians(config, services, sql)
+    pull_courses(config, services, sql)
+    pull_course_endpoints(config, services, sql, roster_endpoints(config))
+
+
+def pull_coursework(config, services, sql):
+    pull_course_endpoints(config, services, sql, coursework_endpoints(config))
+
+
+def run_daemon(config, services, sql):
+    """
+    Keeps running, pulling each group of endpoints on its own interval while reusing
+    the same credentials, API services and database connection pool.
+    """
+    roster_pulls = [config.PULL_GUARDIANS, config.PULL_GUARDIAN_INVITES]
+    roster_pulls += [config.PULL_COURSES]
+    roster_pulls += [enabled for (enabled, _) in roster_endpoints(config)]
+    coursework_pulls = [enabled for (enabled, _) in coursework_endpoints(config)]
+    jobs = [
+        ("usage", config.USAGE_INTERVAL_HOURS, config.PULL_USAGE, pull_usage),
+        ("rosters", config.ROSTER_INTERVAL_HOURS, any(roster_pulls), pull_rosters),
+        (
+            "coursework",
+            config.COURSEWORK_INTERVAL_HOURS,
+            any(coursework_pulls),
+            pull_coursework,
+        ),
+        (
+            "submissions",
+            config.SUBMISSIONS_INTERVAL_HOURS,
+            config.PULL_SUBMISSIONS,
+            pull_submissions,
+        ),
+        ("meet", config.MEET_INTERVAL_HOURS, config.PULL_MEET, pull_meet),
+    ]
+    scheduler = Scheduler(on_error=notify_job_error)
+    for (name, interval_hours, enabled, pull) in jobs:
+        if enabled:
+            job = partial(run_job, pull, config, services, sql)
+            scheduler.add(name, interval_hours, job)
+    scheduler.run_forever()
+
+
+def run_job(pull, config, services, sql):
+    """
+    Runs a daemon pull and reports how the connection pool was used so far. Only the
+    profiles of the job's own pulls are kept, for the email if it fails.
+    """
+    PROFILES.clear()
+    pull(config, services, sql)
+    logging.info(sql.pool_stats.summary())
+
+
+def notify_job_error(job_name, error_message):
+    """Emails the error from a failed daemon job, unless the mailer is disabled."""
+    if not Config.DISABLE_MAILER:
+        jobname = f"Google Classroom Connector: {job_name}"
+        Mailer(Config, jobname).notify(error_message=error_message, profiles=PROFILES)
 
 
-def sync_all_data(config, creds, sql):
-    classroom_service = build("classroom", "v1", credentials=creds)
-    (to_create, to_delete) = Courses(classroom_service, sql, config).sync_data()
+def sync_all_data(config, services, sql):
+    (to_create, to_delete) = Courses(services["classroom"], sql, config).sync_data()
     print("Data syncing is not yet available.")
 
 
@@ -175,4 +318,4 @@ if __name__ == "__main__":
         error_message = traceback.format_exc()
     if not Config.DISABLE_MAILER:
         jobname = f"Google Classroom Connector{Config.get_args()}"
-        Mailer(Config, jobname).notify(error_message=error_message)
+        Mailer(Config, jobname).notify(error_message=error_message, profiles=PROFILES)
@@ -0,0 +1,53 @@
+from sqlalchemy import create_engine, event
+
+
+def configure_pool(sql, config, **engine_options):
+    """
+    Replaces the engine sqlsorcery created with one using a connection pool sized by
+    DB_POOL_SIZE and DB_MAX_OVERFLOW. Connections are checked before use, so ones
+    dropped by the server during a long pull are replaced instead of failing.
+    """
+    url = sql.engine.url
+    sql.engine.dispose()
+    sql.engine = create_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        **engine_options,
+    )
+
+
+class PoolStats:
+    """
+    Counts connection pool events, so the run summary shows how the pool was used.
+
+    Parameters:
+        engine: The SQLAlchemy engine whose pool is observed.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def summary(self):
+        return (
+            f"Database pool: {self.connects} connections opened,"
+            f" {self.checkouts} checkouts, {self.invalidations} invalidated."
+            f" {self.engine.pool.status()}"
+        )
@@ -0,0 +1,97 @@
+import cProfile
+from functools import wraps
+import logging
+import os
+import pstats
+import tracemalloc
+
+# Summaries of the hottest functions of each profiled pull, for the email.
+PROFILES = []
+
+
+class Profile:
+    """
+    Profiles the code run inside it with cProfile when PROFILE is set, and traces
+    memory allocations with tracemalloc when PROFILE_MEMORY is also set. The profile
+    is saved to data/<name>.prof for tools like snakeviz, allocations are reported in
+    data/<name>_memory.txt, and the hottest functions are logged.
+
+    Parameters:
+        name:   The name of what is profiled, like an endpoint.
+        config: A config object with the profiling settings.
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.enabled = config.PROFILE
+        self.trace_memory = config.PROFILE_MEMORY
+        self.top = config.PROFILE_TOP
+        self.profiler = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        if self.enabled:
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.profiler:
+            return
+        self.profiler.disable()
+        os.makedirs("data", exist_ok=True)
+        filename = f"data/{self.name.lower()}.prof"
+        self.profiler.dump_stats(filename)
+        summary = self.summary()
+        if tracemalloc.is_tracing():
+            summary += "\n" + self._report_memory(tracemalloc.take_snapshot())
+        if self.started_tracing:
+            tracemalloc.stop()
+        logging.info(summary)
+        PROFILES.append(summary)
+
+    def summary(self):
+        """Returns the functions that took the most time themselves."""
+        stats = pstats.Stats(self.profiler).stats
+        hottest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        hottest = hottest[: self.top]
+        lines = [
+            f"{self.name}: hottest functions, saved to data/{self.name.lower()}.prof"
+        ]
+        for ((filename, line, function), (_, calls, own, cumulative, _)) in hottest:
+            lines.append(
+                f"  {round(own, 3)}s own, {round(cumulative, 3)}s total,"
+                f" {calls} calls: {function} ({os.path.basename(filename)}:{line})"
+            )
+        return "\n".join(lines)
+
+    def _report_memory(self, snapshot):
+        """Writes the lines that allocated the most memory, returning a summary."""
+        statistics = snapshot.statistics("lineno")[: self.top]
+        filename = f"data/{self.name.lower()}_memory.txt"
+        with open(filename, "w") as file:
+            for statistic in statistics:
+                file.write(f"{statistic}\n")
+        total = sum([statistic.size for statistic in snapshot.statistics("filename")])
+        largest = statistics[0] if statistics else "nothing"
+        return (
+            f"{self.name}: {round(total / 2 ** 20, 1)} MiB allocated and still held,"
+            f" most by {largest}. See {filename}."
+        )
+
+
+def profiled(func):
+    """
+    Decorator that profiles an endpoint method when PROFILE is set. Add to a method
+    as: @profiled
+    """
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with Profile(self.classname(), self.config):
+            return func(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,150 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+
+# The latest progress of each endpoint, by endpoint name.
+PROGRESS = {}
+
+
+class Progress:
+    """
+    Tracks how far along an endpoint's pull is: requests completed and queued, pages
+    discovered, records received and throughput. The ETA uses the page counts and
+    latency recorded by previous runs, so it doesn't jump as new pages are found.
+
+    Parameters:
+        name:       The name of the endpoint being pulled.
+        history:    The endpoint's PullHistory.
+        config:     A config object with the logging interval.
+    """
+
+    def __init__(self, name, history, config):
+        self.name = name
+        self.history = history
+        self.log_interval = config.PROGRESS_LOG_SECONDS
+        self.started = time.time()
+        self.last_logged = self.started
+        self.finished = None
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.pages_discovered = 0
+        self.records = 0
+        self.duplicates = 0
+        self.expected_requests = 0
+        PROGRESS[name] = self
+
+    def start(self, history_keys):
+        """Registers the first page of each request, by its key in history."""
+        self.queued = len(history_keys)
+        self.expected_requests = sum(
+            [self.history.expected_pages(key) for key in history_keys]
+        )
+
+    def record_response(self, records, has_next_page):
+        self.completed += 1
+        self.records += records
+        if has_next_page:
+            self.pages_discovered += 1
+            self.queued += 1
+
+    def record_queued(self, requests):
+        """Registers requests queued by an endpoint beyond the next pages."""
+        self.queued += requests
+
+    def record_duplicates(self, records):
+        """Registers records dropped because they were already received."""
+        self.duplicates += records
+
+    def record_failure(self):
+        self.completed += 1
+        self.failed += 1
+
+    def finish(self):
+        self.finished = time.time()
+        logging.info(self.summary())
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def seconds_per_request(self):
+        """The latency observed this run, falling back to previous runs."""
+        if self.completed > 0:
+            return self.elapsed() / self.completed
+        return self.history.data["seconds_per_request"]
+
+    def eta(self):
+        """Returns the estimated seconds remaining, or None if there's no estimate."""
+        if self.finished:
+            return 0
+        seconds_per_request = self.seconds_per_request()
+        if seconds_per_request is None:
+            return None
+        expected = max(self.expected_requests, self.queued)
+        return max(0, expected - self.completed) * seconds_per_request
+
+    def to_dict(self):
+        elapsed = self.elapsed()
+        return {
+            "endpoint": self.name,
+            "finished": self.finished is not None,
+            "completed_requests": self.completed,
+            "failed_requests": self.failed,
+            "queued_requests": self.queued - self.completed,
+            "expected_requests": max(self.expected_requests, self.queued),
+            "pages_discovered": self.pages_discovered,
+            "records": self.records,
+            "duplicates": self.duplicates,
+            "records_per_second": round(self.records / elapsed, 2) if elapsed else 0,
+            "elapsed_seconds": round(elapsed, 2),
+            "eta_seconds": None if self.eta() is None else round(self.eta(), 2),
+        }
+
+    def summary(self):
+        status = self.to_dict()
+        summary = (
+            f"{self.name}: {status['completed_requests']} of"
+            f" {status['expected_requests']} requests completed,"
+            f" {status['queued_requests']} queued,"
+            f" {status['pages_discovered']} pages discovered,"
+            f" {status['records']} records at {status['records_per_second']}/s."
+        )
+        if status["duplicates"]:
+            summary += f" {status['duplicates']} duplicates dropped."
+        if status["eta_seconds"] is not None and not status["finished"]:
+            summary += f" ETA {round(status['eta_seconds'] / 60, 1)} minutes."
+        return summary
+
+    def log_if_due(self):
+        """Logs a summary if it has been at least the logging interval since the last."""
+        if time.time() - self.last_logged >= self.log_interval:
+            self.last_logged = time.time()
+            logging.info(self.summary())
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Responds to any GET request with the progress of every endpoint as JSON."""
+
+    def do_GET(self):
+        body = json.dumps(
+            {name: progress.to_dict() for (name, progress) in PROGRESS.items()}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Status server: {format % args}")
+
+
+def start_status_server(host, port):
+    """Serves progress over HTTP from a background thread."""
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logging.info(f"Serving pull progress at http://{host}:{port}/")
+    return server
@@ -0,0 +1,120 @@
+import logging
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.exc import NoSuchTableError
+
+from sql_chunks import chunks
+
+
+class Rollup:
+    """
+    A table of aggregates of an endpoint's table, kept up to date after each load.
+    The rollup is partitioned by its first group column, like courseId, and only the
+    partitions touched by the rows written this run are recomputed and replaced.
+    When the endpoint's table is replaced, the rollup is built from its staging table
+    into a staging table of its own, which the endpoint swaps in along with it.
+
+    Parameters:
+        endpoint:   The endpoint whose table is aggregated.
+        name:       The suffix of the rollup table's name.
+        group_by:   The columns the rows are grouped by.
+        columns:    The columns of the endpoint's table that are aggregated.
+        aggregate:  A function of a dataframe of rows and `group_by` that returns
+                    the aggregates of each group as a dataframe.
+    """
+
+    def __init__(self, endpoint, name, group_by, columns, aggregate):
+        self.endpoint = endpoint
+        self.sql = endpoint.sql
+        self.table_name = f"{endpoint.table_name}_{name}"
+        self.load_table_name = self.table_name
+        self.group_by = group_by
+        self.columns = columns
+        self.aggregate = aggregate
+        self.touched = set()
+
+    def start(self):
+        self.touched = set()
+
+    def track(self, df):
+        """Records the partitions touched by a written batch."""
+        self.touched.update(df[self.group_by[0]].dropna().drop_duplicates().tolist())
+
+    def start_staging(self):
+        """Builds the rollup of an overwriting pull into an empty staging table."""
+        self.load_table_name = f"{self.table_name}_Staging"
+        self.endpoint._drop_table(self.load_table_name)
+
+    def reset(self):
+        """Drops the rollup."""
+        self.endpoint._drop_table(self.table_name)
+
+    def refresh(self):
+        """Recomputes the touched partitions from the endpoint's loaded table."""
+        if not self.touched:
+            return
+        source = self.sql.table(self.endpoint.load_table_name)
+        partition = self.group_by[0]
+        touched = sorted(self.touched)
+        logging.debug(
+            f"{self.load_table_name}: recomputing {len(touched)} {partition}"
+            " partitions."
+        )
+        for chunk in chunks(touched):
+            query = select([source.c[column] for column in self.columns]).where(
+                source.c[partition].in_(chunk)
+            )
+            rows = pd.read_sql(query, con=self.sql.engine)
+            aggregates = self.aggregate(rows, self.group_by)
+            self._replace(partition, chunk, aggregates)
+        self.touched = set()
+
+    def _replace(self, partition, values, aggregates):
+        """Replaces the rollup rows of the partitions in one transaction."""
+        try:
+            table = self.sql.table(self.load_table_name)
+        except NoSuchTableError:
+            table = None
+        with self.sql.engine.begin() as connection:
+            if table is not None:
+                connection.execute(table.delete().where(table.c[partition].in_(values)))
+            aggregates.to_sql(
+                self.load_table_name,
+                connection,
+                schema=self.sql.schema,
+                if_exists="append",
+                index=False,
+            )
+
+
+def submission_counts(df, group_by):
+    """Counts submissions, and those turned in, late and missing, with their rates."""
+    turned_in = df["state"].isin(["TURNED_IN", "RETURNED"])
+    late = df["late"].fillna(False).astype(bool)
+    counts = (
+        df.assign(turned_in=turned_in, late=late, missing=late & ~turned_in)
+        .groupby(group_by)
+        .agg(
+            submissions=("id", "count"),
+            turned_in=("turned_in", "sum"),
+            late=("late", "sum"),
+            missing=("missing", "sum"),
+        )
+        .reset_index()
+    )
+    counts["late_rate"] = counts["late"] / counts["submissions"]
+    counts["missing_rate"] = counts["missing"] / counts["submissions"]
+    return counts
+
+
+def daily_active_users(df, group_by):
+    """Counts the users reported each day, and those active that day."""
+    last_used = pd.to_datetime(df["LastUsedTime"]).dt.normalize()
+    active = df["Email"].where(last_used == pd.to_datetime(df["AsOfDate"]))
+    return (
+        df.assign(active=active)
+        .groupby(group_by)
+        .agg(users=("Email", "nunique"), active_users=("active", "nunique"))
+        .reset_index()
+    )
@@ -0,0 +1,65 @@
+import logging
+import time
+import traceback
+
+
+class Job:
+    """A named function that should run every `interval_hours` hours."""
+
+    def __init__(self, name, interval_hours, func):
+        self.name = name
+        self.interval = interval_hours * 3600
+        self.func = func
+        # Every job runs once when the scheduler starts.
+        self.next_run = time.time()
+
+    def run(self):
+        self.next_run = time.time() + self.interval
+        self.func()
+
+
+class Scheduler:
+    """
+    Runs jobs on their own intervals inside one long-running process. Jobs run one at
+    a time, so a job that comes due while another is running starts once it is done.
+    Triggers that overlap are coalesced: a job that came due several times while it
+    waited only runs once.
+
+    Parameters:
+        on_error:   A function called with the job name and traceback when a job
+                    fails. The scheduler keeps running either way.
+    """
+
+    def __init__(self, on_error=None):
+        self.jobs = []
+        self.on_error = on_error
+
+    def add(self, name, interval_hours, func):
+        logging.info(f"Scheduler: running {name} every {interval_hours} hours.")
+        self.jobs.append(Job(name, interval_hours, func))
+
+    def run_pending(self):
+        """Runs each job that is due, in the order they came due."""
+        due_jobs = [job for job in self.jobs if job.next_run <= time.time()]
+        for job in sorted(due_jobs, key=lambda job: job.next_run):
+            logging.info(f"Scheduler: starting {job.name}.")
+            try:
+                job.run()
+            except Exception as e:
+                logging.exception(e)
+                if self.on_error:
+                    self.on_error(job.name, traceback.format_exc())
+
+    def seconds_until_next_run(self):
+        next_run = min([job.next_run for job in self.jobs])
+        return max(0, next_run - time.time())
+
+    def run_forever(self):
+        if not self.jobs:
+            logging.info("Scheduler: no pulls are enabled.")
+            return
+        while True:
+            self.run_pending()
+            wait = self.seconds_until_next_run()
+            logging.debug(f"Scheduler: sleeping for {round(wait)} seconds.")
+            time.sleep(wait)
@@ -0,0 +1,294 @@
+from datetime import datetime
+import logging
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Index, select, types
+from sqlalchemy.exc import NoSuchTableError
+
+from dedupe import digest
+from sql_chunks import CHUNK_SIZE, chunks, execute_in_chunks
+
+
+class SqlSink:
+    """
+    Writes processed batches into the endpoint's SQL table, and keeps the endpoint's
+    rollups of the table up to date. Overwriting pulls are loaded into a staging table
+    that replaces the table when the pull finishes, so readers never see it partly
+    loaded.
+
+    Parameters:
+        endpoint:   The endpoint whose batches are written.
+        config:     A config object for customizing the output.
+    """
+
+    def __init__(self, endpoint, config):
+        self.endpoint = endpoint
+        self.rows_written = 0
+        self.staged = False
+        for rollup in endpoint.rollups:
+            rollup.start()
+
+    def reset(self):
+        """Loads an overwriting pull into a staging table in place of the output."""
+        self.endpoint._start_staging()
+        self.staged = True
+
+    def reset_ranges(self, column, ranges):
+        """Removes the rows of the ranges an incremental endpoint is reprocessing."""
+        self.endpoint._delete_ranges(column, ranges)
+
+    def write(self, df):
+        self.endpoint._write_to_db(df)
+        self.rows_written += len(df)
+        for rollup in self.endpoint.rollups:
+            rollup.track(df)
+
+    def close(self):
+        """
+        Swaps in the staging table of an overwriting pull, indexes the table and
+        refreshes its statistics once it is loaded, then recomputes the rollups it
+        touched. Rollups of a replaced table are rebuilt from its staging table
+        first, and swapped in along with it.
+        """
+        if self.staged:
+            for rollup in self.endpoint.rollups:
+                rollup.refresh()
+            self.endpoint._swap_staging()
+            self.staged = False
+        if self.rows_written > 0:
+            self.endpoint._build_indexes()
+            self.endpoint._update_statistics()
+            for rollup in self.endpoint.rollups:
+                rollup.refresh()
+
+
+class ParquetSink:
+    """
+    Streams processed batches into compressed Parquet files under
+    PARQUET_DIR/<table name>/, partitioned by the date of the pull or by course.
+    Each batch becomes its own file, so memory use never exceeds one batch.
+
+    Parameters:
+        endpoint:   The endpoint whose batches are written.
+        config:     A config object for customizing the output.
+    """
+
+    def __init__(self, endpoint, config):
+        self.endpoint = endpoint
+        self.directory = os.path.join(config.PARQUET_DIR, endpoint.table_name)
+        self.partition = config.PARQUET_PARTITION
+        self.compression = config.PARQUET_COMPRESSION
+        self.run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+        self.run_date = datetime.now().strftime("%Y-%m-%d")
+        self.files_written = 0
+
+    def _partition_directories(self, df):
+        """Splits the batch into (directory, dataframe) pairs by partition."""
+        if self.partition == "course" and "courseId" in df.columns:
+            return [
+                (os.path.join(self.directory, f"courseId={course_id}"), course_df)
+                for (course_id, course_df) in df.groupby("courseId")
+            ]
+        return [(os.path.join(self.directory, f"date={self.run_date}"), df)]
+
+    def reset(self):
+        """
+        Removes the previous output before an overwriting pull: the whole table when
+        partitioning by course, or only today's partition when partitioning by date.
+        """
+        if self.partition == "course":
+            directory = self.directory
+        else:
+            directory = os.path.join(self.directory, f"date={self.run_date}")
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+    def schema(self):
+        """Builds an Arrow schema from the endpoint's column types."""
+        return pa.schema(
+            [
+                (column, self.endpoint.column_type(column).arrow_type)
+                for column in self.endpoint.columns
+            ]
+        )
+
+    def _to_table(self, df):
+        df = df.copy()
+        for column in df.columns:
+            # String columns may hold other JSON values, which Arrow won't coerce.
+            if df[column].dtype == "object":
+                values = df[column]
+                df[column] = values.where(values.isna(), values.astype(str))
+        return pa.Table.from_pandas(df, schema=self.schema(), preserve_index=False)
+
+    def write(self, df):
+        for (directory, partition_df) in self._partition_directories(df):
+            os.makedirs(directory, exist_ok=True)
+            self.files_written += 1
+            filename = f"part-{self.run_id}-{self.files_written:05d}.parquet"
+            path = os.path.join(directory, filename)
+            table = self._to_table(partition_df)
+            pq.write_table(table, path, compression=self.compression)
+            logging.debug(
+                f"{self.endpoint.classname()}: wrote {len(partition_df)} records to"
+                f" {path}."
+            )
+
+    def close(self):
+        logging.debug(
+            f"{self.endpoint.classname()}: wrote {self.files_written} Parquet files."
+        )
+
+
+class HistorySink:
+    """
+    Keeps a type 2 history of the endpoint's rows in <table name>_History, which
+    isn't dropped between pulls. Each row is hashed over its columns and compared with
+    the hash of the current version of its natural key. Only new and changed rows are
+    written, with valid_from set to the time of the pull, and the versions they
+    replace get the same time as valid_to. After a full pull, keys that weren't
+    returned are closed the same way. The current versions are read per batch, for
+    its keys only, so memory doesn't grow with the history.
+
+    Parameters:
+        endpoint:   The endpoint whose batches are written.
+        config:     A config object for customizing the output.
+    """
+
+    def __init__(self, endpoint, config):
+        self.endpoint = endpoint
+        self.sql = endpoint.sql
+        self.table_name = f"{endpoint.table_name}_History"
+        self.pulled_at = datetime.utcnow()
+        self.seen = set()
+        self.full_pull = False
+        self.rows_written = 0
+        self.rows_unchanged = 0
+
+    def reset(self):
+        """
+        History is kept, but an overwriting pull returns every row that exists. An
+        archive being reprocessed may not, like when some of its requests failed.
+        """
+        self.full_pull = not self.endpoint.reprocessing
+
+    def reset_ranges(self, column, ranges):
+        """History is kept, and reprocessed rows that didn't change aren't written."""
+
+    def _history_table(self):
+        try:
+            return self.sql.table(self.table_name)
+        except NoSuchTableError:
+            return None
+
+    def _current_versions(self, key_hashes):
+        """Returns the row hash of the current version of each key that has one."""
+        table = self._history_table()
+        if table is None:
+            return {}
+        current = {}
+        for chunk in chunks(set(key_hashes)):
+            query = select([table.c.key_hash, table.c.row_hash]).where(
+                table.c.valid_to.is_(None) & table.c.key_hash.in_(chunk)
+            )
+            current.update(self.sql.engine.execute(query).fetchall())
+        return current
+
+    def _unseen_keys(self):
+        """Returns the keys with a current version that weren't seen this run."""
+        table = self._history_table()
+        if table is None:
+            return []
+        query = select([table.c.key_hash]).where(table.c.valid_to.is_(None))
+        unseen = []
+        with self.sql.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            rows = result.fetchmany(CHUNK_SIZE)
+            while rows:
+                unseen.extend([key for (key,) in rows if key not in self.seen])
+                rows = result.fetchmany(CHUNK_SIZE)
+        return unseen
+
+    def _sql_types(self):
+        sql_types = self.endpoint._sql_types()
+        sql_types["key_hash"] = types.BigInteger()
+        sql_types["row_hash"] = types.BigInteger()
+        sql_types["valid_from"] = types.DateTime()
+        sql_types["valid_to"] = types.DateTime()
+        return sql_types
+
+    def _close_versions(self, connection, key_hashes):
+        """Ends the current versions of the keys at the time of the pull."""
+        table = self._history_table()
+        if table is None:
+            return
+        statement = (
+            table.update()
+            .where(table.c.valid_to.is_(None))
+            .values(valid_to=self.pulled_at)
+        )
+        execute_in_chunks(connection, statement, table.c.key_hash, key_hashes)
+
+    def write(self, df):
+        endpoint = self.endpoint
+        key_hashes = [digest(key) for key in endpoint._key_tuples(df)]
+        row_hashes = [
+            digest(row) for row in endpoint._value_tuples(df, endpoint.columns)
+        ]
+        self.seen.update(key_hashes)
+        current = self._current_versions(key_hashes)
+        changed = [
+            current.get(key_hash) != row_hash
+            for (key_hash, row_hash) in zip(key_hashes, row_hashes)
+        ]
+        self.rows_unchanged += changed.count(False)
+        if not any(changed):
+            return
+        replaced = [
+            key_hash
+            for (key_hash, is_changed) in zip(key_hashes, changed)
+            if is_changed and key_hash in current
+        ]
+        rows = df.loc[changed].assign(
+            key_hash=[key for (key, c) in zip(key_hashes, changed) if c],
+            row_hash=[row for (row, c) in zip(row_hashes, changed) if c],
+            valid_from=self.pulled_at,
+            valid_to=pd.NaT,
+        )
+        created = self._history_table() is None
+        with self.sql.engine.begin() as connection:
+            self._close_versions(connection, replaced)
+            rows.to_sql(
+                self.table_name,
+                connection,
+                schema=self.sql.schema,
+                if_exists="append",
+                index=False,
+                dtype=self._sql_types(),
+            )
+        if created:
+            table = self._history_table()
+            name = f"ix_{self.table_name}_key_hash"[:63]
+            Index(name, table.c.key_hash).create(bind=self.sql.engine)
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Ends the versions of deleted keys, if every row was pulled successfully."""
+        deleted = []
+        failed = getattr(self.endpoint, "dead_letters", [])
+        if self.full_pull and not failed:
+            deleted = self._unseen_keys()
+            with self.sql.engine.begin() as connection:
+                self._close_versions(connection, deleted)
+        logging.info(
+            f"{self.endpoint.classname()}: history has {self.rows_written} new or"
+            f" changed rows, {self.rows_unchanged} unchanged and {len(deleted)}"
+            " deleted."
+        )
+
+
+SINK_TYPES = {"sql": SqlSink, "parquet": ParquetSink, "history": HistorySink}
@@ -0,0 +1,16 @@
+# Keeps the values in each IN clause under the parameter limits of every database.
+CHUNK_SIZE = 1000
+
+
+def chunks(values, size=CHUNK_SIZE):
+    """Yields the values in lists of up to `size`, CHUNK_SIZE by default."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        end = start + size
+        yield values[start:end]
+
+
+def execute_in_chunks(connection, statement, column, values):
+    """Executes an update or delete for the rows whose column is in the values."""
+    for chunk in chunks(values):
+        connection.execute(statement.where(column.in_(chunk)))
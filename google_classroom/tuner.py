@@ -0,0 +1,66 @@
+import logging
+
+
+class AutoTuner:
+    """
+    Adjusts an endpoint's batch size and page size between batches based on the
+    observed batch latency, timeouts and quota errors. Sizes grow additively while
+    batches stay fast and shrink multiplicatively on trouble, always within the
+    configured bounds. The learned sizes are kept in the endpoint's history so the
+    next run starts from them.
+
+    Parameters:
+        name:       The name of the endpoint being tuned, used for logging.
+        history:    The PullHistory to persist the learned sizes in.
+        batch_size: The configured batch size, used as the upper bound.
+        page_size:  The configured page size, used as the upper bound.
+        config:     A config object with the tuning bounds and targets.
+    """
+
+    def __init__(self, name, history, batch_size, page_size, config):
+        self.name = name
+        self.history = history
+        self.max_batch_size = batch_size
+        self.max_page_size = page_size
+        self.min_batch_size = min(config.MIN_BATCH_SIZE, batch_size)
+        self.min_page_size = min(config.MIN_PAGE_SIZE, page_size)
+        self.target_seconds = config.TARGET_BATCH_SECONDS
+        self.max_quota_rate = config.MAX_QUOTA_RATE
+        learned = history.data.get("tuning", {})
+        self.batch_size = self._bound_batch(learned.get("batch_size", batch_size))
+        self.page_size = self._bound_page(learned.get("page_size", page_size))
+
+    def _bound_batch(self, size):
+        return int(max(self.min_batch_size, min(self.max_batch_size, size)))
+
+    def _bound_page(self, size):
+        return int(max(self.min_page_size, min(self.max_page_size, size)))
+
+    def observe(self, seconds, requests, quota_errors, timed_out):
+        """Updates the sizes from the outcome of a batch of `requests` requests."""
+        if requests == 0:
+            return
+        if timed_out:
+            # Responses are too big to come back in time, so shrink both.
+            self.batch_size = self._bound_batch(self.batch_size / 2)
+            self.page_size = self._bound_page(self.page_size / 2)
+        elif quota_errors / requests > self.max_quota_rate:
+            self.batch_size = self._bound_batch(self.batch_size / 2)
+        elif seconds > self.target_seconds:
+            self.batch_size = self._bound_batch(self.batch_size * 0.75)
+        elif requests >= self.batch_size:
+            # Only grow when the batch was full, otherwise the size wasn't tested.
+            self.batch_size = self._bound_batch(
+                self.batch_size + max(1, self.max_batch_size // 10)
+            )
+            self.page_size = self._bound_page(
+                self.page_size + max(1, self.max_page_size // 10)
+            )
+        logging.debug(
+            f"{self.name}: tuned to batch size {self.batch_size}"
+            f" and page size {self.page_size}."
+        )
+        self.history.data["tuning"] = {
+            "batch_size": self.batch_size,
+            "page_size": self.page_size,
+        }
@@ -1,3 +1,10 @@
+from functools import lru_cache
+
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+import pandas as pd
+
+from field_mask import apply_field_mask
 from tests.responses import (
     ALIAS_RESPONSE,
     ANNOUNCEMENT_RESPONSE,
@@ -16,6 +23,12 @@ from tests.responses import (
 )
 
 
+@lru_cache(maxsize=None)
+def parse_time(value):
+    """Parses an API time, which windows split in tests request many times over."""
+    return pd.to_datetime(value)
+
+
 class FakeBatchRequest:
     def __init__(self, callback):
         self.callback = callback
@@ -30,6 +43,22 @@ class FakeBatchRequest:
             self.callback(request_id, result, None)
 
 
+class FakeMissingCourseBatchRequest(FakeBatchRequest):
+    """Responds with a 404 to requests for the missing course IDs."""
+
+    def __init__(self, callback, missing_course_ids):
+        super().__init__(callback)
+        self.missing_course_ids = missing_course_ids
+
+    def execute(self):
+        for (request, request_id) in self.requests:
+            if request.kwargs.get("courseId") in self.missing_course_ids:
+                error = HttpError(Response({"status": 404}), b"Not found")
+                self.callback(request_id, None, error)
+            else:
+                self.callback(request_id, request.execute(), None)
+
+
 class FakeRequest:
     def __init__(self, result, *args, **kwargs):
         self.result = result
@@ -37,6 +66,23 @@ class FakeRequest:
         self.kwargs = kwargs
 
     def execute(self):
+        result = self._filter_states(self._result())
+        # Mimic the API's partial responses so masks are exercised by every test.
+        if self.kwargs.get("fields"):
+            result = apply_field_mask(result, self.kwargs["fields"])
+        return result
+
+    def _filter_states(self, result):
+        """Mimics the API's filters on course and submission or invite states."""
+        for (argument, field) in [("courseStates", "courseState"), ("states", "state")]:
+            states = self.kwargs.get(argument)
+            if states and result:
+                key = list(result.keys())[0]
+                items = [item for item in result[key] if item.get(field) in states]
+                result = {key: items}
+        return result
+
+    def _result(self):
         if "courseId" in self.kwargs:
             course_id = self.kwargs["courseId"]
             if course_id is not None:
@@ -49,7 +95,30 @@ class FakeRequest:
                     matches = values[:1] if course_id == "1" else values[1:]
                 else:
                     matches = [item for item in values if item["courseId"] == course_id]
+                coursework_id = self.kwargs.get("courseWorkId")
+                if coursework_id not in [None, "-"]:
+                    matches = [
+                        item
+                        for item in matches
+                        if item.get("courseWorkId") == coursework_id
+                    ]
                 return {key: matches}
+        if self.kwargs.get("startTime"):
+            # Only activities from the start time until before the end time, in pages,
+            # like the Reports API.
+            start_time = parse_time(self.kwargs["startTime"])
+            end_time = parse_time(self.kwargs.get("endTime") or "2100-01-01Z")
+            items = [
+                item
+                for item in self.result["items"]
+                if start_time <= parse_time(item["id"]["time"]) < end_time
+            ]
+            offset = int(self.kwargs.get("pageToken") or 0)
+            page_end = offset + (self.kwargs.get("maxResults") or len(items))
+            page = {"items": items[offset:page_end]}
+            if page_end < len(items):
+                page["nextPageToken"] = str(page_end)
+            return page
         if "date" in self.kwargs:
             date = self.kwargs["date"]
             return self.result.get(date)
@@ -118,3 +187,13 @@ class FakeService:
 
     def activities(self):
         return FakeEndpoint(MEET_RESPONSE)
+
+
+class FakeMissingCourseService(FakeService):
+    """A service where requests for some courses fail as if they were deleted."""
+
+    def __init__(self, missing_course_ids):
+        self.missing_course_ids = missing_course_ids
+
+    def new_batch_http_request(self, callback):
+        return FakeMissingCourseBatchRequest(callback, self.missing_course_ids)
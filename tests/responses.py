@@ -389,8 +389,8 @@ STUDENT_SUBMISSION_SOLUTION = pd.DataFrame(
             pd.to_datetime("2020-04-02 17:44:34.89"),
         ],
         "state": ["RETURNED", "RETURNED"],
-        "draftGrade": [30, 80],
-        "assignedGrade": [40, 95],
+        "draftGrade": [30.0, 80.0],
+        "assignedGrade": [40.0, 95.0],
         "courseWorkType": ["ASSIGNMENT", "ASSIGNMENT"],
         "createdTime": [
             pd.to_datetime("2020-04-02 19:41:15.29"),
@@ -404,13 +404,13 @@ STUDENT_SUBMISSION_SOLUTION = pd.DataFrame(
             pd.to_datetime("2020-04-10 19:41:15.29"),
             pd.to_datetime("2020-04-09 17:44:34.89"),
         ],
-        "draftMaxPoints": [100, 100],
+        "draftMaxPoints": [100.0, 100.0],
         "draftGradeTimestamp": [
             pd.to_datetime("2020-04-11 19:41:15.29"),
             pd.to_datetime("2020-04-10 17:44:34.89"),
         ],
         "draftGraderId": ["80", "80"],
-        "assignedMaxPoints": [100, 100],
+        "assignedMaxPoints": [100.0, 100.0],
         "assignedGradeTimestamp": [
             pd.to_datetime("2020-04-12 19:41:15.29"),
             pd.to_datetime("2020-04-11 17:44:34.89"),
@@ -543,7 +543,7 @@ COURSEWORK_SOLUTION = pd.DataFrame(
             pd.to_datetime("2020-04-28 14:28:20.82"),
         ],
         "dueDate": [None, pd.to_datetime("2020-05-01 06:59:00")],
-        "maxPoints": [100, 100],
+        "maxPoints": [100.0, 100.0],
         "workType": ["ASSIGNMENT", "QUIZ"],
         "assigneeMode": ["ALL_STUDENTS", "ALL_STUDENTS"],
         "submissionModificationMode": [
@@ -658,7 +658,7 @@ MEET_SOLUTION = pd.DataFrame(
         "conference_id": ["123ABC", "123ABC", "DEF456"],
         "device_type": ["web", "web", "android"],
         "display_name": ["Name", "Name2", "Name3"],
-        "duration_seconds": ["1000", "1500", "2000"],
+        "duration_seconds": [1000, 1500, 2000],
         "endpoint_id": ["abcde", "bcdef", "cdefg"],
         "identifier": ["person@email.com", "person@email.com", "person2@email.com"],
         "identifier_type": ["email_address", "email_address", "email_address"],
@@ -743,5 +743,43 @@ MEET_RESPONSE = {
                 }
             ],
         },
+        {
+            "id": {"time": "2020-05-25T20:42:18.59Z"},
+            "events": [
+                {
+                    "name": "presentation_started",
+                    "parameters": [
+                        {"name": "identifier_type", "value": "email_address"},
+                        {"name": "endpoint_id", "value": "cdefg"},
+                        {"name": "identifier", "value": "person2@email.com"},
+                        {"name": "conference_id", "value": "DEF456"},
+                        {"name": "meeting_code", "value": "ASDFG"},
+                        {"name": "is_external", "boolValue": True},
+                        {"name": "presentation_type", "value": "tab"},
+                    ],
+                }
+            ],
+        },
+    ],
+}
+
+# Newest first, like the API. A host ended the call for everyone, so three events
+# share the time of the second, and a page of two splits them.
+MEET_BOUNDARY_RESPONSE = {
+    "items": [MEET_RESPONSE["items"][2]]
+    + [
+        {
+            "id": {"time": "2020-05-24T18:42:18.59Z"},
+            "events": [
+                {
+                    "name": "call_ended",
+                    "parameters": [
+                        {"name": "endpoint_id", "value": endpoint_id},
+                        {"name": "conference_id", "value": "123ABC"},
+                    ],
+                }
+            ],
+        }
+        for endpoint_id in ["bcdef", "fghij", "ghijk"]
     ],
 }
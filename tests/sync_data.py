@@ -29,6 +29,8 @@ SOURCE_DATA = pd.DataFrame(
         "teacher_email": ["a@b.com", "a@b.com", "a@b.com", "a@b.com"],
     }
 )
+# Written to a sync file, since syncing a dataframe prefixes its aliases in place.
+SOURCE_FILE_DATA = SOURCE_DATA.copy()
 
 TO_CREATE_SOLUTION = pd.DataFrame(
     {
@@ -1,7 +1,16 @@
+from datetime import datetime
+import socket
+import time
+
 import pandas as pd
+import pytest
+import sqlalchemy
+from sqlalchemy.dialects import mssql
 from config import TestConfig, db_generator
+from endpoints import base
 
 from endpoints import (
+    batch_pull_combined,
     Announcements,
     Courses,
     CourseAliases,
@@ -16,9 +25,19 @@ from endpoints import (
     StudentUsage,
     Teachers,
     Topics,
+    Users,
 )
 
-from mock_response import FakeService
+from cassettes import Cassette, RecordingService, ReplayService
+from field_mask import mask_savings
+from hedge import Hedger
+from main import run_job
+from history import PullHistory
+from profiler import PROFILES
+from progress import PROGRESS
+from tuner import AutoTuner
+import mock_response
+from mock_response import FakeService, FakeMissingCourseService
 from responses import (
     ALIAS_SOLUTION,
     ANNOUNCEMENT_SOLUTION,
@@ -34,11 +53,17 @@ from responses import (
     TEACHER_SOLUTION,
     TOPIC_SOLUTION,
     MEET_SOLUTION,
+    MEET_RESPONSE,
+    MEET_BOUNDARY_RESPONSE,
+    ORG_UNIT_RESPONSE,
+    STUDENT_SUBMISSION_RESPONSE,
+    TEACHER_RESPONSE,
 )
 from sync_data import (
     COURSE_DATA,
     ALIAS_DATA,
     SOURCE_DATA,
+    SOURCE_FILE_DATA,
     TO_CREATE_SOLUTION,
     TO_DELETE_SOLUTION,
 )
@@ -50,6 +75,10 @@ class TestPulls:
         self.sql = db_generator(self.config)
         self.service = FakeService()
 
+    def override_config(self, **settings):
+        """Returns the test config with the settings overridden."""
+        return type("OverrideConfig", (self.config,), settings)
+
     def test_get_org_units(self):
         self.generic_get_test(
             OrgUnits(self.service, self.sql, self.config), ORG_UNIT_SOLUTION
@@ -90,6 +119,91 @@ class TestPulls:
     def test_get_meet(self):
         self.generic_get_test(Meet(self.service, self.sql, self.config), MEET_SOLUTION)
 
+    def test_meet_reruns_skip_stored_events(self):
+        meet = Meet(self.service, self.sql, self.config)
+        meet._drop_table()
+        meet.history.data.pop("watermark", None)
+        meet.batch_pull_data(overwrite=False)
+        # Rerun with a lookback that reaches back over the last two events.
+        meet.history.data["watermark"] = "2020-05-25T00:00:00.000000Z"
+        meet.batch_pull_data(overwrite=False)
+        assert meet.last_date == "2020-05-24T00:00:00.000000Z"
+        self.generic_get_test(meet, MEET_SOLUTION, overwrite=False)
+
+    def test_meet_reruns_upsert_past_dedupe_limit(self):
+        meet = Meet(self.service, self.sql, self.override_config(DEDUPE_MAX_KEYS=1))
+        meet._drop_table()
+        meet.batch_pull_data(overwrite=False)
+        assert meet.seen_keys.full
+        meet.history.data["watermark"] = "2020-05-25T00:00:00.000000Z"
+        self.generic_get_test(meet, MEET_SOLUTION, overwrite=False)
+
+    def test_meet_repulls_dropped_table(self):
+        meet = Meet(self.service, self.sql, self.config)
+        meet._drop_table()
+        meet.batch_pull_data(overwrite=False)
+        meet._drop_table()
+        # The watermark of the first pull is kept, but there is nothing to continue.
+        self.generic_get_test(meet, MEET_SOLUTION, overwrite=False)
+
+    def test_meet_times_precise_on_mssql(self):
+        meet = Meet(self.service, self.sql, self.config)
+        sql_type = meet._sql_types()["item_time"]
+        assert sql_type.compile(dialect=mssql.dialect()) == "DATETIME2"
+
+    def test_meet_other_events_in_own_tables(self):
+        config = self.override_config(
+            MEET_EVENTS=["call_ended", "presentation_started"]
+        )
+        meet = Meet(self.service, self.sql, config)
+        assert meet.request_data().kwargs["eventName"] is None
+        self.generic_get_test(meet, MEET_SOLUTION)
+        (presentations,) = meet.event_endpoints
+        result = presentations.return_all_data()
+        assert presentations.table_name == "GoogleClassroom_Meet_presentation_started"
+        assert list(result["conference_id"]) == ["DEF456"]
+        assert list(result["parameters"]) == ['{"presentation_type": "tab"}']
+        presentations._drop_table()
+
+    def test_meet_reprocess_needs_every_event_table_cleared(self, tmp_path):
+        config = self.override_config(
+            MEET_EVENTS=["call_ended", "presentation_started"],
+            SINK_OVERRIDES={"Meet_presentation_started": ["parquet"]},
+            PARQUET_DIR=str(tmp_path),
+        )
+        meet = Meet(self.service, self.sql, config)
+        meet.batch_pull_data()
+        (presentations,) = meet.event_endpoints
+        assert type(presentations).classname() == "Meet_presentation_started"
+        meet.sinks = meet._build_sinks()
+        meet._start_events(overwrite=False)
+        # Parquet files can't be cleared by time, so call_ended isn't either.
+        assert not meet._reset_sinks([(datetime(2020, 5, 1), datetime(2020, 6, 1))])
+        assert meet.return_all_data().equals(MEET_SOLUTION)
+        meet._drop_table()
+
+    def test_meet_windows(self):
+        meet = Meet(self.service, self.sql, self.config)
+        windows = meet._time_windows(datetime(2020, 5, 23), datetime(2020, 5, 25, 12))
+        assert windows[-1] == "2020-05-25T00:00:00.000000Z/2020-05-25T12:00:00.000000Z"
+        assert len(windows) == 3
+        # A dense window is split before the oldest event on its first page.
+        window = "2020-05-23T00:00:00.000000Z/2020-05-26T00:00:00.000000Z"
+        assert meet._split_window(window, MEET_RESPONSE["items"]) == [
+            "2020-05-23T00:00:00.000000Z/2020-05-23T08:51:09.295000Z",
+            "2020-05-23T08:51:09.295000Z/2020-05-23T17:42:18.591000Z",
+        ]
+
+    def test_meet_split_keeps_events_at_boundary(self, monkeypatch):
+        monkeypatch.setattr(mock_response, "MEET_RESPONSE", MEET_BOUNDARY_RESPONSE)
+        meet = Meet(self.service, self.sql, self.override_config(PAGE_SIZE=2))
+        meet.batch_pull_data(
+            dates=["2020-05-24T00:00:00.000000Z/2020-05-26T00:00:00.000000Z"]
+        )
+        result = meet.return_all_data()
+        assert sorted(result["endpoint_id"]) == ["bcdef", "cdefg", "fghij", "ghijk"]
+        meet._drop_table()
+
     def test_get_topics(self):
         self.generic_get_test(
             Topics(self.service, self.sql, self.config),
@@ -111,6 +225,179 @@ class TestPulls:
             course_ids=["1", "2"],
         )
 
+    def test_rollups_recompute_touched_groups(self):
+        config = self.override_config(BUILD_ROLLUPS=True)
+        usage = StudentUsage(self.service, self.sql, config, None)
+        usage._drop_table()
+        usage.batch_pull_data(dates=["2020-02-27"], overwrite=False)
+        usage.batch_pull_data(dates=["2020-02-28"], overwrite=False)
+        (daily,) = usage.rollups
+        result = pd.read_sql_table(daily.table_name, con=self.sql.engine)
+        assert list(result["users"]) == [2, 1]
+        assert list(result["active_users"]) == [1, 0]
+        daily.reset()
+        usage._drop_table()
+
+        submissions = StudentSubmissions(self.service, self.sql, config)
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        by_course = submissions.rollups[0]
+        result = pd.read_sql_table(by_course.table_name, con=self.sql.engine)
+        assert list(result["courseId"]) == ["1", "2"]
+        assert list(result["turned_in"]) == [1, 1]
+        for rollup in submissions.rollups:
+            rollup.reset()
+        submissions._drop_table()
+
+    def test_rollups_swapped_in_with_table(self, monkeypatch):
+        submissions = StudentSubmissions(
+            self.service, self.sql, self.override_config(BUILD_ROLLUPS=True)
+        )
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        visible = []
+
+        def update_statistics():
+            inspector = sqlalchemy.inspect(self.sql.engine)
+            for rollup in submissions.rollups:
+                visible.append(inspector.has_table(rollup.table_name))
+
+        monkeypatch.setattr(submissions, "_update_statistics", update_statistics)
+        submissions.batch_pull_data(course_ids=["1"])
+        # The rollups are already replaced once the table is.
+        assert visible == [True, True, True]
+        result = pd.read_sql_table(
+            submissions.rollups[0].table_name, con=self.sql.engine
+        )
+        assert list(result["courseId"]) == ["1"]
+        # A pull that finds nothing drops the rollups with the table.
+        submissions.batch_pull_data(course_ids=["3"])
+        inspector = sqlalchemy.inspect(self.sql.engine)
+        assert not any(
+            [inspector.has_table(rollup.table_name) for rollup in submissions.rollups]
+        )
+
+    def test_history_sink_writes_changes(self):
+        config = self.override_config(SINKS=["sql", "history"])
+        topics = Topics(self.service, self.sql, config)
+        history_table = f"{topics.table_name}_History"
+        self.sql.engine.execute(f"DROP TABLE IF EXISTS {history_table}")
+        topics.batch_pull_data(course_ids=["1", "2"])
+        # An unchanged pull writes nothing, and a changed topic writes a version.
+        topics.batch_pull_data(course_ids=["1", "2"])
+        topics.preprocess_records = lambda records: [
+            dict(record, name="Renamed") if record["courseId"] == "1" else record
+            for record in records
+        ]
+        topics.batch_pull_data(course_ids=["1", "2"])
+        # A topic no longer returned is closed.
+        topics.batch_pull_data(course_ids=["1"])
+        result = pd.read_sql_table(history_table, con=self.sql.engine)
+        assert list(result["name"]) == list(TOPIC_SOLUTION["name"]) + ["Renamed"]
+        assert list(result["valid_to"].isna()) == [False, False, True]
+        self.sql.engine.execute(f"DROP TABLE {history_table}")
+        topics._drop_table()
+
+    def test_history_kept_when_reprocessing_partial_pull(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(base, "DEAD_LETTER_FILE", str(tmp_path / "dead.jsonl"))
+        config = self.override_config(SINKS=["sql", "history"], DEBUGFILE=True)
+        topics = Topics(self.service, self.sql, config)
+        topics.filename = str(tmp_path / "topics.jsonl.gz")
+        history_table = f"{topics.table_name}_History"
+        self.sql.engine.execute(f"DROP TABLE IF EXISTS {history_table}")
+        topics.batch_pull_data(course_ids=["1", "2"])
+        # Course 2 fails, so the archive only holds course 1.
+        failing = Topics(FakeMissingCourseService(["2"]), self.sql, config)
+        failing.filename = topics.filename
+        failing.batch_pull_data(course_ids=["1", "2"])
+
+        offline = Topics(None, self.sql, config)
+        offline.filename = topics.filename
+        offline.reprocess_archive()
+        result = pd.read_sql_table(history_table, con=self.sql.engine)
+        assert list(result["valid_to"].isna()) == [True, True]
+        self.sql.engine.execute(f"DROP TABLE {history_table}")
+        offline._drop_table()
+
+    def test_large_courses_fan_out(self, monkeypatch):
+        coursework = {
+            "courseWork": [{"courseId": "1", "id": id} for id in ["123", "9"]]
+        }
+        monkeypatch.setattr(mock_response, "COURSEWORK_RESPONSE", coursework)
+        submissions = StudentSubmissions(self.service, self.sql, self.config)
+        submissions.history.data["course_records"] = {"1": 10000, "2": 1}
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        result = submissions.return_all_data().sort_values("courseId")
+        assert result.reset_index(drop=True).equals(STUDENT_SUBMISSION_SOLUTION)
+        # Course 1 took a request for its course work, then one per course work,
+        # and course 2 a single request.
+        assert PROGRESS["StudentSubmissions"].to_dict()["completed_requests"] == 4
+        assert submissions.history.data["course_records"] == {"1": 1, "2": 1}
+        submissions._drop_table()
+
+    def test_new_courses_paged_before_fanning_out(self):
+        submissions = StudentSubmissions(self.service, self.sql, self.config)
+        submissions.history.data["course_records"] = {}
+        submissions._start_pull(["1"], [None], overwrite=False)
+        (_, request_id) = submissions.remaining_requests.pop()
+        page = {"studentSubmissions": [{"id": "1"}], "nextPageToken": "token"}
+        submissions._handle_response(request_id, page, None)
+        (_, next_request_id) = submissions.remaining_requests.pop()
+        assert next_request_id == "1;None;token;1;1000"
+        assert submissions.remaining_requests == []
+        assert submissions.run_course_records == {"1": 1}
+
+    def test_profiled_pull(self, tmp_path, monkeypatch):
+        config = self.override_config(PROFILE=True, PROFILE_MEMORY=True)
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "data").mkdir()
+        topics = Topics(self.service, self.sql, config)
+        self.generic_get_test(topics, TOPIC_SOLUTION, course_ids=["1", "2"])
+        assert (tmp_path / "data" / "topics.prof").exists()
+        assert (tmp_path / "data" / "topics_memory.txt").exists()
+        assert PROFILES[-1].startswith("Topics: hottest functions")
+
+    def test_daemon_job_keeps_only_its_profiles(self):
+        PROFILES.append("Topics: an earlier job")
+
+        def pull(config, services, sql):
+            PROFILES.append("Courses: this job")
+
+        run_job(pull, TestConfig, None, self.sql)
+        assert PROFILES == ["Courses: this job"]
+        PROFILES.clear()
+
+    def test_server_side_filters(self):
+        config = self.override_config(
+            COURSE_STATES=["ACTIVE"],
+            SUBMISSION_STATES=["TURNED_IN"],
+            GUARDIAN_INVITES_SINCE="2020-05-01",
+        )
+        courses = Courses(self.service, self.sql, config)
+        assert courses.request_data().kwargs["courseStates"] == ["ACTIVE"]
+        self.generic_get_test(courses, COURSE_SOLUTION)
+        submissions = StudentSubmissions(self.service, self.sql, config)
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        assert submissions.return_all_data() is None
+        self.generic_get_test(
+            GuardianInvites(self.service, self.sql, config),
+            GUARDIAN_INVITE_SOLUTION.loc[[1]].reset_index(drop=True),
+        )
+
+    def test_normalized_rosters(self):
+        config = self.override_config(NORMALIZE_ROSTERS=True)
+        users = Users(self.service, self.sql, config)
+        users._drop_table()
+        # Students are pulled twice, so their profiles are upserted again.
+        for endpoint in [Students, Teachers, Students]:
+            endpoint = endpoint(self.service, self.sql, config)
+            endpoint.batch_pull_data(course_ids=["1", "2"])
+            assert list(endpoint.return_all_data().columns) == ["courseId", "userId"]
+            endpoint._drop_table()
+        result = users.return_all_data().sort_values("userId")
+        # A user enrolled twice is written once, with the first profile seen.
+        assert list(result["userId"]) == ["1", "2", "321", "555"]
+        assert list(result["fullName"])[-1] == "Boss Lady"
+        users._drop_table()
+
     def test_get_aliases(self):
         self.generic_get_test(
             CourseAliases(self.service, self.sql, self.config),
@@ -146,8 +433,269 @@ class TestPulls:
             course_ids=["1", "2"],
         )
 
-    def generic_get_test(self, endpoint, solution, course_ids=[None], dates=[None]):
-        endpoint.batch_pull_data(course_ids=course_ids, dates=dates)
+    def test_combined_pull(self):
+        endpoints = [
+            Topics(self.service, self.sql, self.config),
+            Students(self.service, self.sql, self.config),
+            Teachers(self.service, self.sql, self.config),
+            CourseAliases(self.service, self.sql, self.config),
+        ]
+        batch_pull_combined(endpoints, ["1", "2"])
+        solutions = [TOPIC_SOLUTION, STUDENT_SOLUTION, TEACHER_SOLUTION, ALIAS_SOLUTION]
+        for (endpoint, solution) in zip(endpoints, solutions):
+            result = pd.read_sql_table(
+                endpoint.table_name, con=self.sql.engine, schema=self.sql.schema
+            )
+            assert result.equals(solution)
+            endpoint._drop_table()
+
+    def test_combined_pull_tunes_each_endpoint_on_its_requests(self, monkeypatch):
+        recorded = []
+
+        def record_batch(history, seconds, requests):
+            recorded.append((history.filename, requests))
+
+        monkeypatch.setattr(PullHistory, "record_batch", record_batch)
+        topics = Topics(self.service, self.sql, self.config)
+        aliases = CourseAliases(self.service, self.sql, self.config)
+        batch_pull_combined([topics, aliases], ["1", "2", "3"])
+        assert recorded == [
+            ("data/topics_history.json", 3),
+            ("data/coursealiases_history.json", 3),
+        ]
+        topics._drop_table()
+        aliases._drop_table()
+
+    def test_dead_letters_missing_courses(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(base, "DEAD_LETTER_FILE", str(tmp_path / "dead.jsonl"))
+        topics = Topics(FakeMissingCourseService(["2"]), self.sql, self.config)
+        self.generic_get_test(
+            topics,
+            TOPIC_SOLUTION[TOPIC_SOLUTION["courseId"] == "1"],
+            course_ids=["1", "2"],
+        )
+        assert [(e["course_id"], e["status"]) for e in topics.dead_letters] == [
+            ("2", 404)
+        ]
+        assert (tmp_path / "dead.jsonl").exists()
+
+    def test_progress_reported(self):
+        topics = Topics(self.service, self.sql, self.config)
+        self.generic_get_test(topics, TOPIC_SOLUTION, course_ids=["1", "2"])
+        status = PROGRESS["Topics"].to_dict()
+        assert status["finished"]
+        assert status["completed_requests"] == 2
+        assert status["queued_requests"] == 0
+        assert status["records"] == 2
+        assert status["eta_seconds"] == 0
+
+    def test_duplicate_records_dropped(self):
+        topics = Topics(self.service, self.sql, self.config)
+        # Topics requests ignore the date, so each page is received twice.
+        self.generic_get_test(
+            topics, TOPIC_SOLUTION, course_ids=["1", "2"], dates=[None, "again"]
+        )
+        assert PROGRESS["Topics"].to_dict()["duplicates"] == 2
+        assert len(topics.seen_keys) == 2
+
+    def test_heaviest_courses_scheduled_first(self):
+        topics = Topics(self.service, self.sql, self.config)
+        topics.history.data["pages"] = {"1;None": 1, "2;None": 40}
+        topics._start_pull(["1", "2", "3"], [None], overwrite=False)
+        request_ids = [request_id for (_, request_id) in topics.remaining_requests]
+        # Requests are popped from the back of the list.
+        assert request_ids == [
+            "3;None;None;0;1000",
+            "1;None;None;0;1000",
+            "2;None;None;0;1000",
+        ]
+
+    def test_overwriting_pull_swaps_in_staging_table(self):
+        topics = Topics(self.service, self.sql, self.config)
+        topics.batch_pull_data(course_ids=["1", "2"])
+        topics._start_pull(["1"], [None], overwrite=True)
+        (request, request_id) = topics.remaining_requests.pop()
+        topics._handle_response(request_id, request.execute(), None)
+        topics._process_batch_data()
+        # Readers see the previous pull until the new one is loaded.
+        assert topics.return_all_data().equals(TOPIC_SOLUTION)
+        topics._finish_pull()
+        assert topics.return_all_data().equals(TOPIC_SOLUTION.iloc[:1])
+        assert topics.load_table_name == topics.table_name
+        topics._drop_table()
+
+    def test_page_size_pinned_for_later_pages(self):
+        topics = Topics(self.service, self.sql, self.config)
+        topics._start_pull(["1"], [None], overwrite=False)
+        (_, request_id) = topics.remaining_requests.pop()
+        # Tuned between the first page and the next.
+        topics.page_size = 50
+        topics._handle_response(request_id, {"nextPageToken": "token"}, None)
+        (request, next_request_id) = topics.remaining_requests.pop()
+        assert next_request_id == "1;None;token;1;1000"
+        assert request.kwargs["pageSize"] == 1000
+        (request, _) = topics._generate_request_tuple("2", None, None, 0)
+        assert request.kwargs["pageSize"] == 50
+
+    def test_history_keeps_last_run(self):
+        topics = Topics(self.service, self.sql, self.config)
+        topics.history.data["pages"] = {"archived;None": 3}
+        self.generic_get_test(topics, TOPIC_SOLUTION, course_ids=["1", "2"])
+        assert topics.history.data["pages"] == {"1;None": 1, "2;None": 1}
+        assert list(topics.history.data["seconds"]) == ["1;None", "2;None"]
+
+    def test_typed_columns(self):
+        submissions = StudentSubmissions(self.service, self.sql, self.config)
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        columns = {
+            column.name: column.type
+            for column in self.sql.table(submissions.table_name).columns
+        }
+        assert isinstance(columns["assignedGrade"], sqlalchemy.types.Float)
+        assert isinstance(columns["late"], sqlalchemy.types.Boolean)
+        assert columns["state"].length == 64
+        assert columns["id"].length == 64
+        submissions._drop_table()
+
+    def test_course_columns_fit_classroom_limits(self):
+        sql_types = Courses(self.service, self.sql, self.config)._sql_types()
+        lengths = [sql_types[column].length for column in ["name", "room", "section"]]
+        assert lengths == [750, 650, 2800]
+
+    def test_indexes_built_after_load(self):
+        submissions = StudentSubmissions(self.service, self.sql, self.config)
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        indexes = sqlalchemy.inspect(self.sql.engine).get_indexes(
+            submissions.table_name, schema=self.sql.schema
+        )
+        assert sorted([index["column_names"] for index in indexes]) == [
+            ["courseId"],
+            ["courseWorkId"],
+            ["userId"],
+        ]
+        # Appending to the table again keeps the existing indexes.
+        submissions.batch_pull_data(course_ids=["1", "2"], overwrite=False)
+        submissions._drop_table()
+
+    def test_text_columns_not_indexed_on_mssql(self, monkeypatch):
+        meet = Meet(self.service, self.sql, self.config)
+        meet._drop_table()
+        # Created before its columns were typed, so conference_id is text.
+        MEET_SOLUTION.to_sql(
+            meet.table_name, self.sql.engine, schema=self.sql.schema, index=False
+        )
+        monkeypatch.setattr(self.sql.engine.dialect, "name", "mssql")
+        meet._build_indexes()
+        indexes = sqlalchemy.inspect(self.sql.engine).get_indexes(
+            meet.table_name, schema=self.sql.schema
+        )
+        assert [index["column_names"] for index in indexes] == [["item_time"]]
+        meet._drop_table()
+
+    def test_pool_stats(self):
+        checkouts = self.sql.pool_stats.checkouts
+        self.generic_get_test(
+            Topics(self.service, self.sql, self.config),
+            TOPIC_SOLUTION,
+            course_ids=["1", "2"],
+        )
+        assert self.sql.pool_stats.checkouts > checkouts
+        assert "checkouts" in self.sql.pool_stats.summary()
+
+    def test_parquet_sink_skips_sql(self, tmp_path):
+        config = self.override_config(
+            SINK_OVERRIDES={"StudentSubmissions": ["parquet"]},
+            PARQUET_DIR=str(tmp_path),
+        )
+        submissions = StudentSubmissions(self.service, self.sql, config)
+        submissions.batch_pull_data(course_ids=["1", "2"])
+        assert submissions.return_all_data() is None
+        files = list((tmp_path / submissions.table_name).glob("date=*/*.parquet"))
+        assert len(files) > 0
+        result = pd.concat([pd.read_parquet(file) for file in files])
+        result = result.reset_index(drop=True)
+        assert list(result.columns) == submissions.columns
+        assert len(result) == len(STUDENT_SUBMISSION_SOLUTION)
+        assert set(result["id"]) == set(STUDENT_SUBMISSION_SOLUTION["id"])
+
+    def test_reprocess_archive(self, tmp_path):
+        config = self.override_config(DEBUGFILE=True)
+        students = Students(self.service, self.sql, config)
+        students.filename = str(tmp_path / "students.jsonl.gz")
+        students.batch_pull_data(course_ids=["1", "2"])
+        students._drop_table()
+
+        offline = Students(None, self.sql, config)
+        offline.filename = students.filename
+        offline.reprocess_archive()
+        result = pd.read_sql_table(
+            offline.table_name, con=self.sql.engine, schema=self.sql.schema
+        )
+        assert result.equals(STUDENT_SOLUTION)
+        offline._drop_table()
+
+    def test_reprocess_keeps_earlier_incremental_pulls(self, tmp_path):
+        config = self.override_config(DEBUGFILE=True)
+        usage = StudentUsage(self.service, self.sql, config, None)
+        usage.filename = str(tmp_path / "studentusage.jsonl.gz")
+        usage.batch_pull_data(dates=["2020-02-27"], overwrite=False)
+        # The archive only holds the last pull.
+        usage.batch_pull_data(dates=["2020-02-28"], overwrite=False)
+
+        offline = StudentUsage(None, self.sql, config, None)
+        offline.filename = usage.filename
+        offline.reprocess_archive()
+        result = pd.read_sql_table(
+            offline.table_name, con=self.sql.engine, schema=self.sql.schema
+        )
+        assert result.equals(STUDENT_USAGE_SOLUTION)
+        offline._drop_table()
+
+    def test_record_and_replay_cassette(self, tmp_path):
+        cassette = Cassette(str(tmp_path / "cassette.jsonl.gz"), salt="test")
+        recording = RecordingService(self.service, cassette)
+        self.generic_get_test(
+            Topics(recording, self.sql, self.config),
+            TOPIC_SOLUTION,
+            course_ids=["1", "2"],
+        )
+
+        topics = Topics(ReplayService(cassette), self.sql, self.config)
+        course_ids = [cassette.anonymize("1"), cassette.anonymize("2")]
+        topics.batch_pull_data(course_ids=course_ids)
+        result = topics.return_all_data()
+        assert len(result) == len(TOPIC_SOLUTION)
+        assert set(result["courseId"]) == set(course_ids)
+        assert list(result["name"]) == list(TOPIC_SOLUTION["name"])
+        topics._drop_table()
+
+    def test_replay_matches_requests_of_other_runs(self, tmp_path):
+        cassette = Cassette(str(tmp_path / "cassette.jsonl.gz"), salt="test")
+        recording = RecordingService(self.service, cassette)
+        usage = StudentUsage(recording, self.sql, self.config, None)
+        usage.batch_pull_data(dates=["2020-02-27", "2020-02-28"])
+        usage._drop_table()
+        guardian = cassette.anonymize_response(
+            {"guardianId": "1", "alternateLink": "https://classroom.google.com/c/1"}
+        )
+        assert guardian == {
+            "guardianId": cassette.anonymize("1"),
+            "alternateLink": cassette.anonymize("https://classroom.google.com/c/1"),
+        }
+
+        # Usage dates are computed each run, so they differ on replay.
+        usage = StudentUsage(ReplayService(cassette), self.sql, self.config, None)
+        usage.batch_pull_data(dates=["2021-03-01", "2021-03-02", "2021-03-03"])
+        assert len(usage.return_all_data()) == len(STUDENT_USAGE_SOLUTION)
+        assert usage.dead_letters == []
+        usage._drop_table()
+
+    def generic_get_test(
+        self, endpoint, solution, course_ids=[None], dates=[None], overwrite=True
+    ):
+        endpoint.batch_pull_data(
+            course_ids=course_ids, dates=dates, overwrite=overwrite
+        )
         result = pd.read_sql_table(
             endpoint.table_name, con=self.sql.engine, schema=self.sql.schema
         )
@@ -155,12 +703,118 @@ class TestPulls:
         endpoint._drop_table()
 
 
+class TestFieldMasks:
+    def setup(self):
+        self.config = TestConfig
+        self.sql = db_generator(self.config)
+        self.service = FakeService()
+
+    def test_masks_shrink_recorded_responses(self):
+        for (endpoint, response) in [
+            (OrgUnits(self.service, self.sql, self.config), ORG_UNIT_RESPONSE),
+            (Teachers(self.service, self.sql, self.config), TEACHER_RESPONSE),
+            (
+                StudentSubmissions(self.service, self.sql, self.config),
+                STUDENT_SUBMISSION_RESPONSE,
+            ),
+        ]:
+            (full_bytes, masked_bytes) = mask_savings(
+                response, endpoint.response_fields()
+            )
+            assert masked_bytes < full_bytes
+
+
+class TestAutoTuner:
+    def setup(self):
+        self.tuner = AutoTuner("Test", PullHistory("Test"), 120, 1000, TestConfig)
+
+    def test_shrinks_on_timeout(self):
+        self.tuner.observe(10, 120, 0, timed_out=True)
+        assert (self.tuner.batch_size, self.tuner.page_size) == (60, 500)
+
+    def test_shrinks_on_quota_errors(self):
+        self.tuner.observe(10, 120, 60, timed_out=False)
+        assert self.tuner.batch_size == 60
+
+    def test_grows_within_bounds(self):
+        self.tuner.observe(10, 120, 60, timed_out=False)
+        for _ in range(10):
+            self.tuner.observe(1, self.tuner.batch_size, 0, timed_out=False)
+        assert (self.tuner.batch_size, self.tuner.page_size) == (120, 1000)
+        assert self.tuner.history.data["tuning"]["batch_size"] == 120
+
+
+class SlowRequest:
+    """Sleeps the first time it or a copy of it is executed."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = []
+
+    def execute(self):
+        self.calls.append(True)
+        if len(self.calls) == 1:
+            time.sleep(self.seconds)
+            return "slow"
+        return "hedge"
+
+
+class TestHedging:
+    def setup(self):
+        class HedgeConfig(TestConfig):
+            HEDGE_REQUESTS = True
+            HEDGE_MIN_SECONDS = 0.05
+            REQUEST_TIMEOUT = 1
+
+        self.config = HedgeConfig
+        self.hedger = Hedger("Test", HedgeConfig)
+
+    def test_first_response_wins(self):
+        response = self.hedger.execute(SlowRequest(0.5))
+        assert response == "hedge"
+        assert (self.hedger.stragglers, self.hedger.hedge_wins) == (1, 1)
+
+    def test_fast_requests_not_hedged(self):
+        response = self.hedger.execute(SlowRequest(0))
+        assert response == "slow"
+        assert self.hedger.stragglers == 0
+
+    def test_times_out(self):
+        self.hedger.disable()
+        with pytest.raises(socket.timeout):
+            self.hedger.execute(SlowRequest(2))
+
+    def test_hedged_pull(self):
+        sql = db_generator(self.config)
+        topics = Topics(FakeService(), sql, self.config)
+        topics.batch_pull_data(course_ids=["1", "2"])
+        result = topics.return_all_data()
+        assert result.equals(TOPIC_SOLUTION)
+        topics._drop_table()
+
+    def test_hedged_combined_pull(self):
+        sql = db_generator(self.config)
+        endpoints = [
+            Topics(FakeService(), sql, self.config),
+            Students(FakeService(), sql, self.config),
+        ]
+        batch_pull_combined(endpoints, ["1"])
+        for (endpoint, solution) in zip(endpoints, [TOPIC_SOLUTION, STUDENT_SOLUTION]):
+            result = endpoint.return_all_data()
+            assert result.equals(solution[solution["courseId"] == "1"])
+            endpoint._drop_table()
+
+
 class TestSync:
     def setup(self):
         self.config = TestConfig
         self.sql = db_generator(self.config)
         self.service = FakeService()
 
+    def teardown(self):
+        Courses(self.service, self.sql, self.config)._drop_table()
+        CourseAliases(self.service, self.sql, self.config)._drop_table()
+
     def test_sync_courses(self):
         courses = Courses(self.service, self.sql, self.config)
         aliases = CourseAliases(self.service, self.sql, self.config)
@@ -169,3 +823,16 @@ class TestSync:
         (to_create, to_delete) = courses.sync_data(SOURCE_DATA)
         assert to_create.equals(TO_CREATE_SOLUTION)
         assert to_delete.equals(TO_DELETE_SOLUTION)
+
+    def test_sync_courses_from_chunked_file(self, tmp_path, monkeypatch):
+        courses = Courses(self.service, self.sql, self.config)
+        aliases = CourseAliases(self.service, self.sql, self.config)
+        self.sql.insert_into(courses.table_name, COURSE_DATA)
+        self.sql.insert_into(aliases.table_name, ALIAS_DATA)
+        (tmp_path / "sync_files").mkdir()
+        SOURCE_FILE_DATA.to_csv(tmp_path / "sync_files" / "courses.csv.gz", index=False)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(self.config, "SYNC_CHUNK_SIZE", 2)
+        (to_create, to_delete) = courses.sync_data()
+        assert to_create.equals(TO_CREATE_SOLUTION)
+        assert to_delete.equals(TO_DELETE_SOLUTION)